@@ -1,20 +1,58 @@
+import asyncio
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from itertools import islice
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from channels.consumer import get_handler_name
 from django.contrib.auth import get_user_model
-from .models import Message, InterestRequest
+from .models import Message, InterestRequest, Attachment, ConversationMember
 from .serializers import MessageSerializer
-from django.db import models
+from .db_routers import pin_primary
+from .versioning import bump_versions, conversation_scope, group_scope
+from .streaming import iterate_in_thread
+from . import presence, heartbeat, drain
+from django.db import connections, models, transaction
+from django.db.models.functions import RowNumber
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Close code sent to sockets that stopped answering heartbeats
+IDLE_CLOSE_CODE = 4000
+# Standard "Service Restart" close code, sent while draining for a deploy
+DRAIN_CLOSE_CODE = 1012
+# Latest messages per conversation returned by a prefetch frame
+PREFETCH_DEFAULT_LIMIT = 20
+PREFETCH_MAX_LIMIT = 100
+# Messages per prefetch_chunk frame
+PREFETCH_CHUNK_SIZE = 200
+
+
+def conversation_group_name(conversation_id):
+    return f"conversation_{conversation_id}"
+
+
+def claim_attachments(message, attachment_ids):
+    """Attach the sender's unsent uploads to a freshly saved message"""
+    if attachment_ids:
+        Attachment.objects.filter(
+            id__in=attachment_ids, uploader_id=message.sender_id, message__isnull=True
+        ).update(message=message)
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.user_group_name = None
         self.user = None
+        self.presence_tracked = False
+        # Event-loop time of the last frame received from the client
+        self.last_seen = None
+        # Group conversations this user belongs to, cached for the connection's lifetime
+        self.conversation_ids = set()
 
     async def connect(self):
         # Get user from scope (authenticated via middleware)
@@ -25,6 +63,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
+        # A draining process takes no new sockets; the client retries elsewhere
+        if drain.is_draining():
+            await self.close()
+            return
+
+        # Count the socket before it can receive anything through its groups;
+        # an uncounted socket could be skipped by local delivery
+        try:
+            await presence.track_connect(self.user.id)
+        except Exception as e:
+            logger.error(f"Error tracking presence of user {self.user.username}: {str(e)}")
+            await self.close()
+            return
+        self.presence_tracked = True
+
         # Create a unique group for this user
         self.user_group_name = f"user_{self.user.id}"
         
@@ -34,7 +87,22 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
+        # Join a channel group per group conversation, so a group message is
+        # one group_send no matter how many members it has
+        self.conversation_ids = await self.get_conversation_ids()
+        await asyncio.gather(*(
+            self.channel_layer.group_add(conversation_group_name(conversation_id), self.channel_name)
+            for conversation_id in self.conversation_ids
+        ))
+
         await self.accept()
+        self.last_seen = asyncio.get_running_loop().time()
+        presence.add_local(self)
+        # A drain that started while this socket was connecting did not see it
+        if drain.is_draining():
+            await self.drain(drain.retry_after_ms())
+            return
+        heartbeat.ensure_reaper()
         logger.info(f"User {self.user.username} connected to chat")
 
         # Send connection confirmation
@@ -44,25 +112,78 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
 
     async def disconnect(self, close_code):
-        # Leave user's personal group
-        if self.user_group_name:
-            await self.channel_layer.group_discard(
-                self.user_group_name,
-                self.channel_name
-            )
-        
+        await self.leave()
+
         if self.user:
             logger.info(f"User {self.user.username} disconnected from chat")
 
+    async def leave(self):
+        """Leave all groups and drop this socket's presence; safe to call twice"""
+        if self.presence_tracked:
+            presence.remove_local(self)
+
+        try:
+            # Leave user's personal group
+            if self.user_group_name:
+                user_group_name, self.user_group_name = self.user_group_name, None
+                await self.channel_layer.group_discard(
+                    user_group_name,
+                    self.channel_name
+                )
+            conversation_ids, self.conversation_ids = self.conversation_ids, set()
+            await asyncio.gather(*(
+                self.channel_layer.group_discard(conversation_group_name(conversation_id), self.channel_name)
+                for conversation_id in conversation_ids
+            ))
+        finally:
+            # Even if Redis failed above: a socket left counted would keep
+            # presence wrong for as long as this process runs
+            if self.presence_tracked:
+                self.presence_tracked = False
+                await presence.track_disconnect(self.user.id)
+
+    async def reap(self):
+        """
+        Close a socket that stopped answering heartbeats. Group memberships are
+        released right away instead of when the dead TCP connection times out.
+        """
+        logger.info(f"Closing idle connection of user {self.user.username}")
+        await self.leave()
+        await self.close(code=IDLE_CLOSE_CODE)
+
+    async def drain(self, retry_after_ms):
+        """Ask the client to reconnect to another worker, then close"""
+        await self.send(text_data=json.dumps({
+            'type': 'reconnect',
+            'retry_after_ms': retry_after_ms
+        }))
+        await self.leave()
+        await self.close(code=DRAIN_CLOSE_CODE)
+
+    async def send_ping(self):
+        await self.send(text_data=json.dumps({'type': 'ping'}))
+
     async def receive(self, text_data):
+        # Any frame proves the client is alive
+        self.last_seen = asyncio.get_running_loop().time()
+        # Counted so a drain can wait for frames that are still being handled
+        drain.work_started()
         try:
             text_data_json = json.loads(text_data)
             message_type = text_data_json.get('type')
 
-            if message_type == 'chat_message':
+            if message_type == 'pong':
+                return
+            elif message_type == 'ping':
+                await self.send(text_data=json.dumps({'type': 'pong'}))
+            elif message_type == 'chat_message':
                 await self.handle_chat_message(text_data_json)
+            elif message_type == 'group_message':
+                await self.handle_group_message(text_data_json)
             elif message_type == 'typing_indicator':
                 await self.handle_typing_indicator(text_data_json)
+            elif message_type == 'prefetch':
+                await self.handle_prefetch(text_data_json)
             else:
                 await self.send_error('Invalid message type')
 
@@ -71,19 +192,23 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error in receive: {str(e)}")
             await self.send_error('Internal server error')
+        finally:
+            drain.work_finished()
 
     async def handle_chat_message(self, data):
         receiver_id = data.get('receiver_id')
         content = data.get('content', '').strip()
+        attachment_ids = data.get('attachment_ids') or []
 
-        if not receiver_id or not content:
+        if not receiver_id or not (content or attachment_ids):
             await self.send_error('Missing receiver_id or content')
             return
 
         try:
             receiver_id = int(receiver_id)
+            attachment_ids = sorted({int(attachment_id) for attachment_id in attachment_ids})
         except (ValueError, TypeError):
-            await self.send_error('Invalid receiver_id')
+            await self.send_error('Invalid receiver_id or attachment_ids')
             return
 
         # Verify mutual connection
@@ -98,8 +223,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.send_error('Receiver not found')
             return
 
+        # Attachments must be the sender's own uploads that were not sent yet
+        if attachment_ids and not await self.check_attachments(attachment_ids):
+            await self.send_error('Invalid attachment_ids')
+            return
+
         # Save message to database
-        message = await self.save_message(self.user, receiver, content)
+        message = await self.save_message(self.user, receiver, content, attachment_ids)
         if not message:
             await self.send_error('Failed to save message')
             return
@@ -114,12 +244,55 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
 
         # Send to receiver (if they're online)
-        receiver_group_name = f"user_{receiver_id}"
+        await self.send_to_user(receiver_id, {
+            'type': 'chat_message_handler',
+            'message': message_data
+        })
+
+    async def handle_group_message(self, data):
+        conversation_id = data.get('conversation_id')
+        content = data.get('content', '').strip()
+        attachment_ids = data.get('attachment_ids') or []
+
+        if not conversation_id or not (content or attachment_ids):
+            await self.send_error('Missing conversation_id or content')
+            return
+
+        try:
+            conversation_id = int(conversation_id)
+            attachment_ids = sorted({int(attachment_id) for attachment_id in attachment_ids})
+        except (ValueError, TypeError):
+            await self.send_error('Invalid conversation_id or attachment_ids')
+            return
+
+        # Membership comes from the consumer's cache, not a query per message
+        if conversation_id not in self.conversation_ids:
+            await self.send_error('You are not a member of this conversation')
+            return
+
+        if attachment_ids and not await self.check_attachments(attachment_ids):
+            await self.send_error('Invalid attachment_ids')
+            return
+
+        message = await self.save_group_message(conversation_id, content, attachment_ids)
+        if not message:
+            await self.send_error('Failed to save message')
+            return
+
+        message_data = await self.serialize_message(message)
+
+        await self.send(text_data=json.dumps({
+            'type': 'message_sent',
+            'message': message_data
+        }))
+
+        # One send reaches every online member, on any worker
         await self.channel_layer.group_send(
-            receiver_group_name,
+            conversation_group_name(conversation_id),
             {
-                'type': 'chat_message_handler',
-                'message': message_data
+                'type': 'group_message_handler',
+                'message': message_data,
+                'sender_channel': self.channel_name
             }
         )
 
@@ -141,16 +314,61 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         # Send typing indicator to receiver
-        receiver_group_name = f"user_{receiver_id}"
-        await self.channel_layer.group_send(
-            receiver_group_name,
-            {
-                'type': 'typing_indicator_handler',
-                'sender_id': self.user.id,
-                'sender_username': self.user.username,
-                'is_typing': is_typing
-            }
-        )
+        await self.send_to_user(receiver_id, {
+            'type': 'typing_indicator_handler',
+            'sender_id': self.user.id,
+            'sender_username': self.user.username,
+            'is_typing': is_typing
+        })
+
+    async def handle_prefetch(self, data):
+        """
+        Send the latest messages of every conversation (connected peers and
+        groups) in prefetch_chunk frames followed by prefetch_complete,
+        instead of one history request per contact.
+        """
+        try:
+            limit = int(data.get('limit', PREFETCH_DEFAULT_LIMIT))
+        except (ValueError, TypeError):
+            await self.send_error('Invalid limit')
+            return
+        if not 1 <= limit <= PREFETCH_MAX_LIMIT:
+            await self.send_error(f'limit must be between 1 and {PREFETCH_MAX_LIMIT}')
+            return
+
+        # Read through a server-side cursor and sent a chunk at a time, so
+        # neither the rows nor the frames build up. The cursor gets a thread
+        # of its own: calls on the shared sync thread would close its connection.
+        count = 0
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # aclosing: a failed send still closes the cursor on its thread
+            async with aclosing(iterate_in_thread(self.prefetch_chunks(limit), executor=executor)) as chunks:
+                async for chunk in chunks:
+                    await self.send(text_data=json.dumps({
+                        'type': 'prefetch_chunk',
+                        'messages': chunk
+                    }))
+                    count += len(chunk)
+        await self.send(text_data=json.dumps({
+            'type': 'prefetch_complete',
+            'count': count
+        }))
+
+    async def send_to_user(self, user_id, event):
+        """
+        Deliver an event to every socket of a user. When all of them live in
+        this process the handlers are called directly, skipping Redis;
+        otherwise the event goes through the user's channel-layer group.
+        """
+        local_consumers = await presence.route(user_id)
+        if local_consumers is None:
+            await self.channel_layer.group_send(f"user_{user_id}", event)
+            return
+        for consumer in local_consumers:
+            try:
+                await getattr(consumer, get_handler_name(event))(event)
+            except Exception as e:
+                logger.error(f"Error delivering locally to user {user_id}: {str(e)}")
 
     async def chat_message_handler(self, event):
         """Handler for incoming chat messages"""
@@ -168,6 +386,36 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'is_typing': event['is_typing']
         }))
 
+    async def group_message_handler(self, event):
+        """Handler for messages sent to a group conversation"""
+        # The sending socket already got a message_sent confirmation
+        if event['sender_channel'] == self.channel_name:
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'group_message_received',
+            'message': event['message']
+        }))
+
+    async def conversation_joined_handler(self, event):
+        """Handler for being added to a group conversation"""
+        conversation_id = event['conversation']['id']
+        if conversation_id not in self.conversation_ids:
+            self.conversation_ids.add(conversation_id)
+            await self.channel_layer.group_add(conversation_group_name(conversation_id), self.channel_name)
+        await self.send(text_data=json.dumps({
+            'type': 'conversation_joined',
+            'conversation': event['conversation']
+        }))
+
+    async def interest_update_handler(self, event):
+        """Handler for interests sent to or answered by another user"""
+        await self.send(text_data=json.dumps({
+            'type': 'interest_update',
+            'interest_id': event['interest_id'],
+            'status': event['status'],
+            'user': event['user']
+        }))
+
     async def send_error(self, error_message):
         """Send error message to client"""
         await self.send(text_data=json.dumps({
@@ -192,18 +440,106 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return None
 
     @database_sync_to_async
-    def save_message(self, sender, receiver, content):
+    def check_attachments(self, attachment_ids):
+        """Check that the attachments are unsent uploads of this user"""
+        return Attachment.objects.filter(
+            id__in=attachment_ids, uploader=self.user, message__isnull=True
+        ).count() == len(attachment_ids)
+
+    @database_sync_to_async
+    def save_message(self, sender, receiver, content, attachment_ids=()):
         """Save message to database"""
         try:
-            return Message.objects.create(
-                sender=sender,
-                receiver=receiver,
-                content=content
-            )
+            pin_primary(sender.id, receiver.id)
+            with transaction.atomic():
+                message = Message.objects.create(
+                    sender=sender,
+                    receiver=receiver,
+                    content=content
+                )
+                claim_attachments(message, attachment_ids)
+            bump_versions(conversation_scope(sender.id, receiver.id))
+            return message
         except Exception as e:
             logger.error(f"Error saving message: {str(e)}")
             return None
 
+    @database_sync_to_async
+    def save_group_message(self, conversation_id, content, attachment_ids=()):
+        """Save a group message once, whatever the number of members"""
+        try:
+            with transaction.atomic():
+                message = Message.objects.create(
+                    sender=self.user,
+                    conversation_id=conversation_id,
+                    content=content
+                )
+                claim_attachments(message, attachment_ids)
+            bump_versions(group_scope(conversation_id))
+            return message
+        except Exception as e:
+            logger.error(f"Error saving group message: {str(e)}")
+            return None
+
+    def prefetch_chunks(self, limit):
+        """Serialized recent messages, PREFETCH_CHUNK_SIZE at a time"""
+        try:
+            rows = self.recent_messages(limit).iterator(chunk_size=PREFETCH_CHUNK_SIZE)
+            while True:
+                batch = list(islice(rows, PREFETCH_CHUNK_SIZE))
+                if not batch:
+                    break
+                models.prefetch_related_objects(batch, 'attachments')
+                yield MessageSerializer(batch, many=True).data
+        finally:
+            # The executor's thread ends with the prefetch; hand its connection back
+            connections.close_all()
+
+    def recent_messages(self, limit):
+        """
+        The latest `limit` messages of each direct conversation with a
+        connected user and of each group, in one query: ROW_NUMBER() over
+        messages partitioned by conversation. Ordered by conversation, then
+        oldest first.
+        """
+        sent_accepted = InterestRequest.objects.filter(sender=self.user, status='accepted').values('receiver_id')
+        received_accepted = InterestRequest.objects.filter(receiver=self.user, status='accepted').values('sender_id')
+        direct = models.Q(conversation__isnull=True) & (
+            models.Q(sender=self.user) & (
+                models.Q(receiver_id__in=sent_accepted) | models.Q(receiver_id__in=received_accepted)
+            ) |
+            models.Q(receiver=self.user) & (
+                models.Q(sender_id__in=sent_accepted) | models.Q(sender_id__in=received_accepted)
+            )
+        )
+        groups = models.Q(conversation_id__in=self.conversation_ids)
+
+        messages = Message.objects.filter(direct | groups).annotate(
+            # The other user of a direct message, NULL for group messages
+            peer=models.Case(
+                models.When(conversation__isnull=False, then=models.Value(None)),
+                models.When(sender=self.user, then=models.F('receiver_id')),
+                default=models.F('sender_id'),
+                output_field=models.BigIntegerField(),
+            ),
+        ).annotate(
+            position=models.Window(
+                RowNumber(),
+                partition_by=[models.F('conversation_id'), models.F('peer')],
+                order_by=[models.F('timestamp').desc(), models.F('id').desc()],
+            ),
+        ).filter(position__lte=limit).select_related('sender', 'receiver').order_by(
+            'conversation_id', 'peer', 'timestamp', 'id'
+        )
+        return messages
+
+    @database_sync_to_async
+    def get_conversation_ids(self):
+        """Ids of the group conversations the user belongs to"""
+        return set(ConversationMember.objects.filter(
+            user=self.user
+        ).values_list('conversation_id', flat=True))
+
     @database_sync_to_async
     def serialize_message(self, message):
         """Serialize message for JSON response"""
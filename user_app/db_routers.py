@@ -0,0 +1,80 @@
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Alias of the replica chosen for the current request, None means primary
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def _pin_key(user_id):
+    return f"db:pin:{user_id}"
+
+
+def pin_primary(*user_ids):
+    """
+    Keep reads for these users on the primary for a short while after a write,
+    so they see their own changes even if the replicas are lagging.
+    """
+    if not settings.DATABASE_REPLICAS:
+        return
+    try:
+        cache.set_many(
+            {_pin_key(user_id): 1 for user_id in user_ids},
+            timeout=settings.DATABASE_REPLICA_PIN_SECONDS
+        )
+    except Exception as e:
+        logger.error(f"Error pinning users {user_ids} to primary: {str(e)}")
+
+
+def read_alias():
+    """The replica the current reads go to, or None for the primary"""
+    return _read_alias.get()
+
+
+@contextmanager
+def replica_reads(user_id):
+    """
+    Route the reads made inside this block to a read replica, unless the user
+    recently wrote something and is still pinned to the primary.
+    """
+    alias = None
+    if settings.DATABASE_REPLICAS:
+        try:
+            if cache.get(_pin_key(user_id)) is None:
+                alias = random.choice(settings.DATABASE_REPLICAS)
+        except Exception as e:
+            # Without the pin information the primary is the only safe choice
+            logger.error(f"Error checking primary pin for user {user_id}: {str(e)}")
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads made inside replica_reads() to a replica; everything else,
+    including all writes and migrations, stays on the default database.
+    """
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+import random
+import signal
+from django.conf import settings
+from . import presence, thumbnails
+
+logger = logging.getLogger(__name__)
+
+DRAIN_SIGNAL = signal.SIGUSR1
+
+_draining = False
+_in_flight = 0
+# Held so the running drain is not garbage collected (the loop keeps only weak references)
+_drain_task = None
+
+
+def is_draining():
+    return _draining
+
+
+def work_started():
+    global _in_flight
+    _in_flight += 1
+
+
+def work_finished():
+    global _in_flight
+    _in_flight -= 1
+
+
+def install_signal_handler():
+    """
+    Drain this process on DRAIN_SIGNAL instead of dropping every socket at
+    once, and record the pid for the drain_websockets management command.
+    """
+    try:
+        signal.signal(DRAIN_SIGNAL, _on_signal)
+    except ValueError:
+        # Not the main thread (e.g. imported by a test runner); nothing to drain
+        logger.warning("Drain signal handler not installed outside the main thread")
+        return
+    try:
+        with open(settings.DRAIN_PIDFILE, 'w') as f:
+            f.write(str(os.getpid()))
+    except OSError as e:
+        logger.warning(f"Could not write drain pidfile: {str(e)}")
+
+
+def _on_signal(signum, frame):
+    logger.info("Drain signal received")
+    try:
+        # Signal handlers run on the main thread, inside the running loop
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _exit()
+        return
+    loop.call_soon_threadsafe(_start_drain)
+
+
+def _start_drain():
+    global _drain_task
+    if _drain_task is None:
+        _drain_task = asyncio.get_running_loop().create_task(drain())
+
+
+def retry_after_ms():
+    """A jittered reconnect delay, so clients do not all come back at once"""
+    return random.randint(settings.DRAIN_RECONNECT_MIN_MS, settings.DRAIN_RECONNECT_MAX_MS)
+
+
+async def drain():
+    """
+    Stop accepting sockets, ask connected clients to reconnect elsewhere with
+    jittered backoff hints spread over DRAIN_WINDOW_SECONDS, wait for
+    in-flight frames and thumbnails to finish, then shut the server down.
+    Everything after the window shares DRAIN_TIMEOUT_SECONDS, so the whole
+    drain fits in the container's stop timeout.
+    """
+    global _draining
+    if _draining:
+        return
+    _draining = True
+
+    consumers = presence.all_local()
+    random.shuffle(consumers)
+    logger.info(f"Draining {len(consumers)} WebSocket connection(s)")
+    pause = settings.DRAIN_WINDOW_SECONDS / len(consumers) if consumers else 0
+    for consumer in consumers:
+        try:
+            await consumer.drain(retry_after_ms())
+        except Exception as e:
+            logger.error(f"Error draining connection: {str(e)}")
+        if pause:
+            await asyncio.sleep(pause)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.DRAIN_TIMEOUT_SECONDS
+    while _in_flight > 0 and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+    if _in_flight > 0:
+        logger.warning(f"Drain timed out with {_in_flight} frame(s) still in flight")
+
+    await loop.run_in_executor(None, thumbnails.shutdown, max(deadline - loop.time(), 0))
+    logger.info("Drain complete, shutting down")
+    _exit()
+
+
+def _exit():
+    # Hand over to Daphne's normal SIGTERM shutdown
+    os.kill(os.getpid(), signal.SIGTERM)
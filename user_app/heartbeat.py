@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from django.conf import settings
+from . import presence
+
+logger = logging.getLogger(__name__)
+
+_reaper_task = None
+
+
+def ensure_reaper():
+    """Start this process's heartbeat/reaper task if it is not running yet."""
+    global _reaper_task
+    if _reaper_task is None or _reaper_task.done():
+        _reaper_task = asyncio.get_running_loop().create_task(_run_reaper())
+
+
+async def _run_reaper():
+    while True:
+        await asyncio.sleep(settings.WEBSOCKET_HEARTBEAT_INTERVAL)
+        try:
+            await ping_or_reap()
+        except Exception as e:
+            logger.error(f"Error in heartbeat reaper: {str(e)}")
+
+
+async def ping_or_reap():
+    """
+    Ping every local socket, and close the ones that have been silent for
+    longer than WEBSOCKET_IDLE_TIMEOUT. One task per process does this, so
+    idle sockets cost no timers of their own.
+    """
+    now = asyncio.get_running_loop().time()
+    reaped = 0
+    for consumer in presence.all_local():
+        # One broken socket must not stop the others from being pinged or reaped
+        try:
+            if now - consumer.last_seen > settings.WEBSOCKET_IDLE_TIMEOUT:
+                await consumer.reap()
+                reaped += 1
+            else:
+                await consumer.send_ping()
+        except Exception as e:
+            logger.error(f"Error in heartbeat of user {consumer.user.username}: {str(e)}")
+    if reaped:
+        logger.info(f"Reaped {reaped} idle WebSocket connection(s)")
+    # Keeps this process's presence entries alive, and repairs them after a lost write
+    await presence.refresh()
@@ -0,0 +1,187 @@
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from user_app.models import Attachment, Message
+from user_app.serializers import MessageSerializer
+from user_app.versioning import bump_versions, conversation_scope, group_scope
+
+POLICIES = ['messages', 'tokens', 'attachments']
+# A batch that waits longer than this for a lock gives up and is retried later
+LOCK_TIMEOUT = '2s'
+LOCK_RETRIES = 5
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the retention policies (see MESSAGE_RETENTION_* in settings): remove "
+        "or archive old messages, expired JWT tokens and orphaned attachments in "
+        "small batches, pausing between batches and waiting for replicas to catch up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=POLICIES, default=POLICIES)
+        parser.add_argument('--message-days', type=int, default=settings.MESSAGE_RETENTION_DAYS)
+        parser.add_argument('--action', choices=['delete', 'archive'], default=settings.MESSAGE_RETENTION_ACTION)
+        parser.add_argument('--batch-size', type=int, default=settings.RETENTION_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=settings.RETENTION_BATCH_PAUSE)
+        parser.add_argument('--dry-run', action='store_true', help="only count what would be removed")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.files_removed = 0
+        self.archive = None
+        now = timezone.now()
+
+        try:
+            if 'messages' in options['only']:
+                if options['message_days'] > 0:
+                    cutoff = now - timedelta(days=options['message_days'])
+                    self.run_policy('messages', Message.objects.filter(timestamp__lt=cutoff),
+                                    'timestamp', self.remove_messages)
+                else:
+                    self.stdout.write(f"{'messages':>12}: kept forever (MESSAGE_RETENTION_DAYS=0)")
+            if 'tokens' in options['only']:
+                # Deleting an outstanding token cascades to its blacklist entry
+                self.run_policy('tokens', OutstandingToken.objects.filter(expires_at__lte=now),
+                                'id', self.remove_tokens)
+            if 'attachments' in options['only']:
+                cutoff = now - timedelta(hours=settings.ATTACHMENT_ORPHAN_HOURS)
+                self.run_policy('attachments', Attachment.objects.filter(message__isnull=True, created_at__lt=cutoff),
+                                'id', self.remove_attachments)
+        finally:
+            if self.archive is not None:
+                self.archive.close()
+                self.stdout.write(f"Archived messages written to {self.archive.name}")
+        if not options['dry_run']:
+            self.stdout.write(f"Attachment files removed: {self.files_removed}")
+
+    def run_policy(self, label, queryset, key, remove):
+        """
+        Walk the expired rows in index order, a batch per transaction. Each batch
+        starts where the previous one ended, so no batch rescans deleted rows.
+        """
+        if self.options['dry_run']:
+            self.stdout.write(f"{label:>12}: {queryset.count()} rows would be removed")
+            return
+
+        started = time.perf_counter()
+        total = batches = 0
+        position = None
+        while True:
+            batch = queryset.order_by(key, 'pk')
+            if position is not None:
+                batch = batch.filter(**{f"{key}__gt" if key == 'id' else f"{key}__gte": position})
+            removed, position = self.with_lock_retries(lambda: self.remove_batch(batch, key, remove))
+            if not removed:
+                break
+            total += removed
+            batches += 1
+            time.sleep(self.options['pause'])
+            self.wait_for_replicas()
+        self.stdout.write(self.style.SUCCESS(
+            f"{label:>12}: {total} rows removed in {batches} batches ({time.perf_counter() - started:.1f}s)"
+        ))
+
+    def remove_batch(self, batch, key, remove):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+            rows = list(batch.values_list('pk', key)[:self.options['batch_size']])
+            if not rows:
+                return 0, None
+            remove([pk for pk, _ in rows])
+        return len(rows), rows[-1][1]
+
+    def with_lock_retries(self, run):
+        for attempt in range(1, LOCK_RETRIES + 1):
+            try:
+                return run()
+            except OperationalError as e:
+                if attempt == LOCK_RETRIES:
+                    raise CommandError(f"Giving up after {attempt} lock timeouts: {str(e)}")
+                self.stderr.write(f"Batch timed out waiting for a lock, retrying: {str(e)}")
+                time.sleep(self.options['pause'] * 10 * attempt)
+
+    def remove_messages(self, ids):
+        messages = Message.objects.filter(pk__in=ids)
+        if self.options['action'] == 'archive':
+            self.archive_messages(messages)
+
+        scopes = set()
+        for sender_id, receiver_id, conversation_id in messages.values_list('sender_id', 'receiver_id', 'conversation_id'):
+            scopes.add(group_scope(conversation_id) if conversation_id else conversation_scope(sender_id, receiver_id))
+        # Attachment rows cascade with their messages, their files do not
+        self.remove_files_on_commit(Attachment.objects.filter(message_id__in=ids))
+        messages.delete()
+        bump_versions(*scopes)
+
+    def archive_messages(self, messages):
+        """
+        Serialize the batch now and append it once its delete commits, so a
+        batch rolled back by a lock timeout is neither archived twice nor
+        archived without being deleted.
+        """
+        rows = messages.select_related('sender', 'receiver').prefetch_related('attachments').order_by('timestamp', 'id')
+        lines = ''.join(json.dumps(item) + '\n' for item in MessageSerializer(rows, many=True).data)
+
+        def append():
+            if self.archive is None:
+                os.makedirs(settings.RETENTION_ARCHIVE_DIR, exist_ok=True)
+                path = os.path.join(settings.RETENTION_ARCHIVE_DIR, f"messages-{timezone.now():%Y%m%dT%H%M%S}.ndjson.gz")
+                self.archive = gzip.open(path, 'wt')
+            self.archive.write(lines)
+            self.archive.flush()
+
+        transaction.on_commit(append)
+
+    def remove_tokens(self, ids):
+        OutstandingToken.objects.filter(pk__in=ids).delete()
+
+    def remove_attachments(self, ids):
+        attachments = Attachment.objects.filter(pk__in=ids)
+        self.remove_files_on_commit(attachments)
+        attachments.delete()
+
+    def remove_files_on_commit(self, attachments):
+        names = [name for pair in attachments.values_list('file', 'thumbnail') for name in pair if name]
+
+        def remove():
+            for name in names:
+                try:
+                    default_storage.delete(name)
+                    self.files_removed += 1
+                except OSError as e:
+                    self.stderr.write(f"Could not remove {name}: {str(e)}")
+
+        transaction.on_commit(remove)
+
+    def wait_for_replicas(self):
+        """Hold the next batch while a PostgreSQL replica lags behind."""
+        for alias in settings.DATABASE_REPLICAS:
+            replica = connections[alias]
+            if replica.vendor != 'postgresql':
+                continue
+            while True:
+                try:
+                    with replica.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+                        )
+                        lag = cursor.fetchone()[0] or 0
+                except Exception as e:
+                    self.stderr.write(f"Could not read replication lag of {alias}: {str(e)}")
+                    break
+                if lag <= settings.RETENTION_MAX_REPLICA_LAG:
+                    break
+                self.stdout.write(f"Waiting for {alias} to catch up ({lag:.1f}s behind)")
+                time.sleep(1)
@@ -0,0 +1,103 @@
+import asyncio
+import statistics
+import time
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+# name -> (CHANNEL_LAYER_BACKENDS key, encrypted)
+VARIANTS = {
+    'core': ('core', False),
+    'core-encrypted': ('core', True),
+    'pubsub': ('pubsub', False),
+    'pubsub-encrypted': ('pubsub', True),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure group_send throughput and delivery latency for each channel "
+        "layer option (backend, encryption) against the configured Redis shards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+        parser.add_argument('--hosts', nargs='+', default=None,
+                            help="Redis URLs to use as shards (default: CHANNEL_REDIS_SHARDS)")
+        parser.add_argument('--messages', type=int, default=1000, help="group_send calls per variant")
+        parser.add_argument('--group-size', type=int, default=10, help="channels in the benchmark group")
+        parser.add_argument('--payload-bytes', type=int, default=256)
+        parser.add_argument('--timeout', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        hosts = options['hosts'] or settings.CHANNEL_REDIS_SHARDS
+        self.stdout.write(f"Shards: {len(hosts)}, group size {options['group_size']}, "
+                          f"{options['messages']} messages of {options['payload_bytes']} bytes")
+        for name in options['variants']:
+            layer = self.build_layer(name, hosts, options['messages'])
+            try:
+                result = asyncio.run(self.run_variant(layer, options))
+            except asyncio.TimeoutError:
+                raise CommandError(f"{name}: timed out after {options['timeout']}s")
+            self.report(name, result, options)
+
+    def build_layer(self, name, hosts, messages):
+        backend, encrypted = VARIANTS[name]
+        config = {'hosts': hosts, 'prefix': 'bench'}
+        if backend == 'core':
+            # Room for every message so slow receivers do not drop any
+            config['capacity'] = messages + 100
+        if encrypted:
+            config['symmetric_encryption_keys'] = [settings.SECRET_KEY]
+        return import_string(settings.CHANNEL_LAYER_BACKENDS[backend])(**config)
+
+    async def run_variant(self, layer, options):
+        messages, group_size = options['messages'], options['group_size']
+        group = f"bench_{uuid.uuid4().hex}"
+        channels = [await layer.new_channel() for _ in range(group_size)]
+        for channel in channels:
+            await layer.group_add(group, channel)
+
+        latencies = []
+
+        async def drain(channel):
+            for _ in range(messages):
+                message = await layer.receive(channel)
+                latencies.append(time.perf_counter() - message['sent_at'])
+
+        receivers = [asyncio.create_task(drain(channel)) for channel in channels]
+        payload = 'x' * options['payload_bytes']
+        start = time.perf_counter()
+        try:
+            for _ in range(messages):
+                await layer.group_send(group, {
+                    'type': 'bench.message',
+                    'sent_at': time.perf_counter(),
+                    'payload': payload,
+                })
+            sent = time.perf_counter() - start
+            await asyncio.wait_for(asyncio.gather(*receivers), options['timeout'])
+            delivered = time.perf_counter() - start
+        finally:
+            for task in receivers:
+                task.cancel()
+            for channel in channels:
+                await layer.group_discard(group, channel)
+            # Only touches keys under the 'bench' prefix
+            await layer.flush()
+        return sent, delivered, latencies
+
+    def report(self, name, result, options):
+        sent, delivered, latencies = result
+        ordered = sorted(latencies)
+
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+        self.stdout.write(
+            f"{name:>17}: {options['messages'] / sent:8.0f} group_send/s, "
+            f"{len(latencies) / delivered:8.0f} deliveries/s, latency "
+            f"mean {statistics.mean(latencies) * 1000:.2f} ms, p50 {percentile(0.50):.2f} ms, "
+            f"p95 {percentile(0.95):.2f} ms, p99 {percentile(0.99):.2f} ms"
+        )
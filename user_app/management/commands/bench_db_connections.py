@@ -0,0 +1,76 @@
+import statistics
+import threading
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare opening a new database connection per request with the configured "
+        "connection mode (DB_CONNECTION_MODE), running each request on its own "
+        "thread the way Daphne runs sync views."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        connection = connections[alias]
+        iterations = options['iterations']
+
+        self.stdout.write(
+            f"Database '{options['database']}', mode '{settings.DB_CONNECTION_MODE}', "
+            f"{iterations} iterations"
+        )
+        fresh = self.measure(iterations, lambda: self.query_new_connection(connection))
+        configured = self.measure(iterations, lambda: self.query_configured(alias))
+
+        self.report('new connection per request', fresh)
+        self.report('configured mode', configured)
+        saved = statistics.mean(fresh) - statistics.mean(configured)
+        self.stdout.write(self.style.SUCCESS(f"Connection setup overhead removed: {saved * 1000:.2f} ms per request"))
+
+    def measure(self, iterations, call):
+        """Time each call on a new thread, as ASGIHandler gives every request its own"""
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            thread = threading.Thread(target=call)
+            thread.start()
+            thread.join()
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    def query_new_connection(self, connection):
+        """A request without pooling: connect, query, disconnect."""
+        raw = connection.Database.connect(**connection.get_connection_params())
+        try:
+            cursor = raw.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+        finally:
+            raw.close()
+
+    def query_configured(self, alias):
+        """
+        A request through Django on a fresh thread: the thread has no connection
+        of its own, and request_finished closes it (back to the pool, if any).
+        """
+        close_old_connections()
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        close_old_connections()
+
+    def report(self, label, timings):
+        ordered = sorted(timings)
+        p95 = ordered[int(len(ordered) * 0.95) - 1] if len(ordered) >= 20 else ordered[-1]
+        self.stdout.write(
+            f"{label:>27}: mean {statistics.mean(timings) * 1000:.2f} ms, "
+            f"p50 {statistics.median(timings) * 1000:.2f} ms, p95 {p95 * 1000:.2f} ms"
+        )
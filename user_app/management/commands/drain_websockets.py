@@ -0,0 +1,29 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from user_app.drain import DRAIN_SIGNAL
+
+
+class Command(BaseCommand):
+    help = (
+        "Tell the running Daphne process to drain: refuse new WebSockets, ask "
+        "connected clients to reconnect elsewhere, finish pending work and exit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pid', type=int, default=None,
+                            help="Process to drain (default: read from DRAIN_PIDFILE)")
+
+    def handle(self, *args, **options):
+        pid = options['pid']
+        if pid is None:
+            try:
+                with open(settings.DRAIN_PIDFILE) as f:
+                    pid = int(f.read().strip())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read pid from {settings.DRAIN_PIDFILE}: {e}")
+        try:
+            os.kill(pid, DRAIN_SIGNAL)
+        except ProcessLookupError:
+            raise CommandError(f"No process with pid {pid}")
+        self.stdout.write(self.style.SUCCESS(f"Drain requested for process {pid}"))
@@ -0,0 +1,248 @@
+import bisect
+import csv
+import io
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.utils import timezone
+
+STATUSES = ['accepted', 'pending', 'rejected']
+STATUS_WEIGHTS = [0.7, 0.2, 0.1]
+WORDS = (
+    "hey hi hello ok sure thanks yes no maybe later today tomorrow tonight "
+    "call me when free how are you good great fine see you soon lol haha "
+    "sounds good what about this weekend did you see that send the photo"
+).split()
+
+# Per-worker state, set up once by _init_worker
+_state = {}
+
+
+def _init_worker(options, password_hash, first_user_id, now):
+    import django
+    django.setup()
+
+    # Zipf popularity by join order: early users are the most connected
+    weights = (1 / (index + 1) ** options['popularity_exponent'] for index in range(options['users']))
+    _state.update(
+        options=options,
+        password_hash=password_hash,
+        first_user_id=first_user_id,
+        now=now,
+        cumulative=list(itertools.accumulate(weights)),
+    )
+
+
+def _rng(phase, start):
+    # Seeded per chunk, so the data does not depend on worker count or scheduling
+    return random.Random(f"{_state['options']['seed']}:{phase}:{start}")
+
+
+def _create_users(start, end):
+    from user_app.models import CustomUser
+
+    options = _state['options']
+    rng = _rng('users', start)
+    prefix = options['prefix']
+    joined_span = options['days'] * 86400
+    users = [
+        CustomUser(
+            id=_state['first_user_id'] + index,
+            username=f"{prefix}_{index}",
+            email=f"{prefix}_{index}@example.com",
+            password=_state['password_hash'],
+            first_name=rng.choice(WORDS).title(),
+            # Earlier indexes joined earlier
+            date_joined=_state['now'] - timedelta(seconds=joined_span * (1 - index / options['users'])),
+        )
+        for index in range(start, end)
+    ]
+    CustomUser.objects.bulk_create(users, batch_size=options['batch_size'])
+    return len(users)
+
+
+def _contact_count(rng, index):
+    """Pareto-distributed number of requests a user sends, scaled to the requested mean"""
+    options = _state['options']
+    alpha = options['contact_alpha']
+    count = int(rng.paretovariate(alpha) * options['contacts'] * (alpha - 1) / alpha)
+    return min(count, options['max_contacts'], index)
+
+
+def _conversation_length(rng):
+    """Log-normal conversation length: most are short, a few are very long"""
+    options = _state['options']
+    sigma = options['message_sigma']
+    mu = math.log(options['messages']) - sigma ** 2 / 2
+    return min(int(rng.lognormvariate(mu, sigma)), options['max_messages'])
+
+
+def _create_contacts(start, end):
+    """
+    Users only send requests to users who joined before them, picked by
+    popularity, so every pair is generated once and the contact graph grows
+    like a real network with a few heavily connected hubs.
+    """
+    from user_app.models import InterestRequest
+
+    options = _state['options']
+    first_user_id = _state['first_user_id']
+    cumulative = _state['cumulative']
+    rng = _rng('contacts', start)
+
+    requests = []
+    messages = []
+    message_count = 0
+    for index in range(start, end):
+        targets = set()
+        for _ in range(_contact_count(rng, index)):
+            targets.add(bisect.bisect_right(cumulative, rng.random() * cumulative[index - 1], 0, index))
+        for target in sorted(targets):
+            status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+            sender_id, receiver_id = first_user_id + index, first_user_id + target
+            requests.append(InterestRequest(sender_id=sender_id, receiver_id=receiver_id, status=status))
+            if status == 'accepted':
+                messages.extend(_conversation(rng, sender_id, receiver_id))
+            if len(messages) >= options['batch_size']:
+                message_count += _insert_messages(messages)
+                messages = []
+
+    InterestRequest.objects.bulk_create(requests, batch_size=options['batch_size'])
+    if messages:
+        message_count += _insert_messages(messages)
+    return len(requests), message_count
+
+
+def _conversation(rng, user_id, other_user_id):
+    options = _state['options']
+    length = _conversation_length(rng)
+    span = options['days'] * 86400
+    timestamp = _state['now'] - timedelta(seconds=rng.uniform(0, span))
+    for _ in range(length):
+        # Bursty replies: mostly seconds to minutes apart, sometimes days
+        timestamp += timedelta(seconds=rng.expovariate(1 / 600) if rng.random() < 0.9 else rng.uniform(3600, 3 * 86400))
+        if timestamp > _state['now']:
+            break
+        sender_id, receiver_id = (user_id, other_user_id) if rng.random() < 0.5 else (other_user_id, user_id)
+        content = ' '.join(rng.choices(WORDS, k=rng.randint(1, 20)))
+        yield sender_id, receiver_id, content, timestamp
+
+
+def _insert_messages(rows):
+    """
+    COPY on PostgreSQL, batched INSERTs elsewhere. Both write the
+    generated timestamps, which bulk_create would replace (auto_now_add).
+    """
+    from user_app.models import Message
+
+    table = connection.ops.quote_name(Message._meta.db_table)
+    columns = ['sender_id', 'receiver_id', 'content', 'timestamp']
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+            if is_psycopg3:
+                with cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+            else:
+                buffer.seek(0)
+                cursor.copy_expert(sql, buffer)
+        else:
+            cursor.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES (%s, %s, %s, %s)",
+                [(sender_id, receiver_id, content, connection.ops.adapt_datetimefield_value(timestamp))
+                 for sender_id, receiver_id, content, timestamp in rows],
+            )
+    return len(rows)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate production-scale users, interest requests and messages for "
+        "capacity tests: power-law contact counts, long-tail conversation "
+        "lengths, deterministic for a given --seed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--contacts', type=float, default=20, help="mean interest requests sent per user")
+        parser.add_argument('--max-contacts', type=int, default=5000)
+        parser.add_argument('--contact-alpha', type=float, default=1.5, help="Pareto shape of contact counts (> 1)")
+        parser.add_argument('--popularity-exponent', type=float, default=0.8,
+                            help="Zipf exponent for who receives requests")
+        parser.add_argument('--messages', type=float, default=30, help="mean messages per accepted connection")
+        parser.add_argument('--max-messages', type=int, default=50000)
+        parser.add_argument('--message-sigma', type=float, default=1.5,
+                            help="log-normal spread of conversation lengths")
+        parser.add_argument('--days', type=int, default=365, help="history spread over this many days")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed', help="username/email prefix of generated users")
+        parser.add_argument('--password', default='password123', help="password of every generated user")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--chunk-size', type=int, default=2000, help="users per worker task")
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        from user_app.models import CustomUser
+
+        if options['contact_alpha'] <= 1:
+            raise CommandError("--contact-alpha must be greater than 1")
+        if CustomUser.objects.filter(username=f"{options['prefix']}_0").exists():
+            raise CommandError(f"Users with prefix '{options['prefix']}' already exist; pick another --prefix")
+
+        # Hashing is deliberately slow: do it once, not per user
+        password_hash = make_password(options['password'])
+        last = CustomUser.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        initargs = (
+            {key: options[key] for key in (
+                'users', 'contacts', 'max_contacts', 'contact_alpha', 'popularity_exponent', 'messages',
+                'max_messages', 'message_sigma', 'days', 'seed', 'prefix', 'batch_size',
+            )},
+            password_hash, last + 1, timezone.now(),
+        )
+        chunks = [
+            (start, min(start + options['chunk_size'], options['users']))
+            for start in range(0, options['users'], options['chunk_size'])
+        ]
+        # Close before workers open their own connections
+        connection.close()
+
+        started = time.perf_counter()
+        if options['workers'] > 1:
+            # spawn: each worker sets up Django and its own database connection
+            with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=initargs,
+            ) as executor:
+                users = sum(executor.map(_create_users, *zip(*chunks)))
+                self.progress('users', users, started)
+                results = list(executor.map(_create_contacts, *zip(*chunks)))
+        else:
+            _init_worker(*initargs)
+            users = sum(_create_users(start, end) for start, end in chunks)
+            self.progress('users', users, started)
+            results = [_create_contacts(start, end) for start, end in chunks]
+        self.progress('interest requests', sum(result[0] for result in results), started)
+        self.progress('messages', sum(result[1] for result in results), started)
+
+        # Users were inserted with explicit ids: move the sequence past them
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [CustomUser]):
+                cursor.execute(sql)
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f}s"))
+
+    def progress(self, label, count, started):
+        self.stdout.write(f"{count:>12} {label} ({time.perf_counter() - started:.1f}s)")
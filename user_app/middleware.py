@@ -1,7 +1,6 @@
 from urllib.parse import parse_qs
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
-from django.db import close_old_connections
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
 import jwt
@@ -43,8 +42,10 @@ class TokenAuthMiddleware(BaseMiddleware):
         self.inner = inner
 
     async def __call__(self, scope, receive, send):  # Fixed method name
-        close_old_connections()
-        
+        # No close_old_connections() here: database_sync_to_async already
+        # returns connections to the pool around every call, and this code
+        # runs on the event loop thread, which holds no connection.
+
         # Extract token from query string
         query_string = scope.get('query_string', b'').decode()
         logger.info(f"WebSocket connection attempt - Query string: {query_string}")
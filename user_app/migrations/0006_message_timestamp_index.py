@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-19 05:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the index without locking the message table against writes
+    atomic = False
+
+    dependencies = [
+        ('user_app', '0005_group_conversations'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='message',
+            index=models.Index(fields=['timestamp'], name='message_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-19 05:20
+
+import django.utils.timezone
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without locking the tables against writes
+    atomic = False
+
+    dependencies = [
+        ('user_app', '0006_message_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='interestrequest',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        AddIndexConcurrently(
+            model_name='customuser',
+            index=models.Index(fields=['updated_at'], name='user_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='interestrequest',
+            index=models.Index(fields=['sender', 'updated_at'], name='interest_sender_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='interestrequest',
+            index=models.Index(fields=['receiver', 'updated_at'], name='interest_receiver_updated_idx'),
+        ),
+    ]
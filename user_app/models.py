@@ -4,6 +4,13 @@ from django.contrib.auth.models import AbstractUser
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     username = models.CharField(max_length=150, unique=True)
+    # Profile changes, for delta sync
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['updated_at'], name='user_updated_idx'),
+        ]
 
     def __str__(self):
         return self.username
@@ -19,18 +26,66 @@ class InterestRequest(models.Model):
     receiver = models.ForeignKey(CustomUser, related_name='received_interests', on_delete=models.CASCADE)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by save() and set explicitly by queryset update() calls
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('sender', 'receiver')
+        indexes = [
+            models.Index(fields=['sender', 'updated_at'], name='interest_sender_updated_idx'),
+            models.Index(fields=['receiver', 'updated_at'], name='interest_receiver_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender} -> {self.receiver} ({self.status})"
 
+class Conversation(models.Model):
+    name = models.CharField(max_length=150)
+    created_by = models.ForeignKey('CustomUser', related_name='created_conversations', null=True, on_delete=models.SET_NULL)
+    members = models.ManyToManyField('CustomUser', through='ConversationMember', related_name='conversations')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ConversationMember(models.Model):
+    conversation = models.ForeignKey(Conversation, related_name='memberships', on_delete=models.CASCADE)
+    user = models.ForeignKey('CustomUser', related_name='conversation_memberships', on_delete=models.CASCADE)
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('conversation', 'user')
+
+    def __str__(self):
+        return f"{self.user} in {self.conversation}"
+
+
 class Message(models.Model):
     sender = models.ForeignKey('CustomUser', related_name='sent_messages', on_delete=models.CASCADE)
-    receiver = models.ForeignKey('CustomUser', related_name='received_messages', on_delete=models.CASCADE)
+    # Direct messages have a receiver; group messages are stored once with a conversation
+    receiver = models.ForeignKey('CustomUser', related_name='received_messages', null=True, blank=True, on_delete=models.CASCADE)
+    conversation = models.ForeignKey(Conversation, related_name='messages', null=True, blank=True, on_delete=models.CASCADE)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['timestamp']
\ No newline at end of file
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['conversation', 'timestamp'], name='message_conversation_ts_idx'),
+            models.Index(fields=['timestamp'], name='message_timestamp_idx'),
+        ]
+
+class Attachment(models.Model):
+    uploader = models.ForeignKey('CustomUser', related_name='attachments', on_delete=models.CASCADE)
+    # Set once the attachment is sent in a message; unattached uploads belong to the uploader only
+    message = models.ForeignKey('Message', related_name='attachments', null=True, blank=True, on_delete=models.CASCADE)
+    file = models.FileField(upload_to='attachments/%Y/%m/%d/')
+    thumbnail = models.ImageField(upload_to='attachments/thumbnails/', null=True, blank=True)
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.uploader})"
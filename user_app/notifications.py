@@ -0,0 +1,28 @@
+import asyncio
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+
+async def _group_send_all(channel_layer, events):
+    await asyncio.gather(*(
+        channel_layer.group_send(f"user_{user_id}", event)
+        for user_id, event in events
+    ))
+
+
+def notify_users(events):
+    """
+    Deliver (user_id, event) pairs to the users' personal groups.
+
+    All sends are issued concurrently in a single hop to the event loop, so
+    notifying many users costs one round of channel-layer calls, not one per user.
+    """
+    if not events:
+        return
+    try:
+        async_to_sync(_group_send_all)(get_channel_layer(), events)
+    except Exception as e:
+        logger.error(f"Error notifying users: {str(e)}")
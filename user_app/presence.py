@@ -0,0 +1,183 @@
+import logging
+import os
+import socket
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# Names this worker's field in every presence hash; unique per process start
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Hash field holding when the hash was (re)created
+SINCE_FIELD = '_since'
+
+# user id -> ChatConsumers of that user connected to this process
+_local_consumers = {}
+# user id -> sockets of that user this process has published, accepted or not
+_socket_counts = {}
+# user id -> monotonic time until which route() sends through the channel
+# layer without asking Redis again; only this safe answer is ever cached
+_channel_layer_until = {}
+# How long a "use the channel layer" decision is reused
+ROUTE_CACHE_SECONDS = 5
+
+
+def _key(user_id):
+    return f"presence:{user_id}"
+
+
+def _ttl():
+    # Outlives a couple of missed heartbeats, so only a dead process's entries expire
+    return settings.WEBSOCKET_HEARTBEAT_INTERVAL * 3
+
+
+def _publish(user_ids):
+    """
+    Write this process's socket count for each user into the user's presence
+    hash (field PROCESS_ID, value "<count>:<unix time>") and push the hash's
+    expiry out. A process that dies stops refreshing: its field goes stale
+    and is dropped by _read(), or vanishes with the hash when no live process
+    has the user either.
+    """
+    now = time.time()
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    for user_id in user_ids:
+        key = _key(user_id)
+        pipe.hsetnx(key, SINCE_FIELD, now)
+        count = _socket_counts.get(user_id, 0)
+        if count:
+            pipe.hset(key, PROCESS_ID, f"{count}:{now}")
+        else:
+            pipe.hdel(key, PROCESS_ID)
+        pipe.expire(key, _ttl())
+    pipe.execute()
+
+
+def _read(user_id):
+    """The user's presence hash, without (and pruned of) fields of dead processes"""
+    redis = get_redis_connection('default')
+    fields = redis.hgetall(_key(user_id))
+    stale = [
+        field for field, value in fields.items()
+        if field != SINCE_FIELD.encode() and time.time() - float(value.split(b':', 1)[1]) > _ttl()
+    ]
+    if stale:
+        redis.hdel(_key(user_id), *stale)
+        for field in stale:
+            del fields[field]
+    return fields
+
+
+# Redis calls go to the thread pool, not the thread shared with sync views
+_publish_async = sync_to_async(_publish, thread_sensitive=False)
+_read_async = sync_to_async(_read, thread_sensitive=False)
+
+
+async def track_connect(user_id):
+    """
+    Count a new socket of the user across all processes. Must run before the
+    socket joins its groups, so the count never misses a reachable socket.
+    Raises when the count could not be published; the socket must not be
+    served then, or messages to it could be routed past it.
+    """
+    _socket_counts[user_id] = _socket_counts.get(user_id, 0) + 1
+    try:
+        await _publish_async([user_id])
+    except Exception:
+        _uncount(user_id)
+        raise
+
+
+async def track_disconnect(user_id):
+    """
+    Uncount a socket of the user, after it has left its groups. A failed
+    write only leaves the shortcut off until the next refresh corrects it.
+    """
+    _uncount(user_id)
+    try:
+        await _publish_async([user_id])
+    except Exception as e:
+        logger.error(f"Error tracking disconnect of user {user_id}: {str(e)}")
+
+
+def _uncount(user_id):
+    count = _socket_counts.get(user_id, 0) - 1
+    if count > 0:
+        _socket_counts[user_id] = count
+    else:
+        _socket_counts.pop(user_id, None)
+
+
+async def refresh():
+    """Republish every count of this process; the heartbeat calls this each interval."""
+    if _socket_counts:
+        await _publish_async(list(_socket_counts))
+
+
+def add_local(consumer):
+    _local_consumers.setdefault(consumer.user.id, set()).add(consumer)
+
+
+def remove_local(consumer):
+    consumers = _local_consumers.get(consumer.user.id)
+    if consumers is not None:
+        consumers.discard(consumer)
+        if not consumers:
+            del _local_consumers[consumer.user.id]
+
+
+def all_local():
+    """Every consumer connected to this process."""
+    return [consumer for consumers in _local_consumers.values() for consumer in consumers]
+
+
+async def route(user_id):
+    """
+    Decide how to reach a user's sockets.
+
+    Returns the list of local consumers when every socket of the user is
+    known to be on this process, an empty list when the user is known to
+    have no socket anywhere, and None whenever the channel layer is needed.
+    Presence is trusted only once its hash has existed for a full refresh
+    round, so a hash lost to eviction or a Redis restart is rebuilt by every
+    live process before anything is skipped; until then, and on any doubt,
+    the answer is None and nothing is ever dropped.
+
+    A None answer is reused for ROUTE_CACHE_SECONDS, so events for users on
+    other processes (typing indicators above all) do not pay a Redis read on
+    top of their group_send.
+    """
+    now = time.monotonic()
+    if _channel_layer_until.get(user_id, 0) > now:
+        return None
+    local = await _decide(user_id)
+    if local is None:
+        if len(_channel_layer_until) > 10000:
+            _channel_layer_until.clear()
+        _channel_layer_until[user_id] = now + ROUTE_CACHE_SECONDS
+    return local
+
+
+async def _decide(user_id):
+    local = list(_local_consumers.get(user_id, ()))
+    try:
+        fields = await _read_async(user_id)
+    except Exception as e:
+        logger.error(f"Error reading presence of user {user_id}: {str(e)}")
+        return None
+
+    since = fields.pop(SINCE_FIELD.encode(), None)
+    if since is None or time.time() - float(since) < settings.WEBSOCKET_HEARTBEAT_INTERVAL * 2:
+        return None
+    # Sockets on other processes
+    if any(field != PROCESS_ID.encode() for field in fields):
+        return None
+    published = fields.get(PROCESS_ID.encode())
+    count = int(published.split(b':', 1)[0]) if published else 0
+    # A socket still connecting is counted but cannot be delivered to yet
+    if count != len(local):
+        return None
+    return local
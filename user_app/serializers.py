@@ -1,10 +1,16 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from .models import InterestRequest, Message
+from django.urls import reverse
+from .models import InterestRequest, Message, Attachment, Conversation
 
 User = get_user_model()
 
+# Largest number of interests handled by one bulk request
+BULK_INTEREST_LIMIT = 500
+# Largest number of members added when creating a group conversation
+GROUP_MEMBER_LIMIT = 1000
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -49,11 +55,51 @@ class InterestRequestSerializer(serializers.ModelSerializer):
         model = InterestRequest
         fields = ['id', 'sender', 'receiver', 'receiver_id', 'status', 'created_at']
         read_only_fields = ['sender', 'status', 'created_at']
+
+class BulkInterestSendSerializer(serializers.Serializer):
+    receiver_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=BULK_INTEREST_LIMIT
+    )
+
+class BulkInterestActionSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=BULK_INTEREST_LIMIT
+    )
+    action = serializers.ChoiceField(choices=['accept', 'reject'])
         
+class AttachmentSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Attachment
+        fields = ['id', 'name', 'content_type', 'size', 'url', 'thumbnail_url', 'created_at']
+
+    def get_url(self, obj):
+        return reverse('attachment_download', args=[obj.pk])
+
+    def get_thumbnail_url(self, obj):
+        # Empty until the thumbnail worker has finished
+        if not obj.thumbnail:
+            return None
+        return reverse('attachment_download', args=[obj.pk]) + '?thumbnail=1'
+
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
     receiver = UserSerializer(read_only=True)
+    attachments = AttachmentSerializer(many=True, read_only=True)
 
     class Meta:
         model = Message
-        fields = ['id', 'sender', 'receiver', 'content', 'timestamp']
\ No newline at end of file
+        fields = ['id', 'sender', 'receiver', 'conversation', 'content', 'attachments', 'timestamp']
+
+class ConversationSerializer(serializers.ModelSerializer):
+    members = UserSerializer(many=True, read_only=True)
+    member_ids = serializers.ListField(
+        child=serializers.IntegerField(), write_only=True, allow_empty=False, max_length=GROUP_MEMBER_LIMIT
+    )
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'name', 'created_by', 'members', 'member_ids', 'created_at']
+        read_only_fields = ['created_by', 'created_at']
\ No newline at end of file
@@ -0,0 +1,93 @@
+import re
+import zlib
+from asgiref.sync import sync_to_async
+
+# wbits value that makes zlib emit a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _next_or_none(iterator):
+    return next(iterator, None)
+
+
+async def iterate_in_thread(iterator, thread_sensitive=True, executor=None):
+    """
+    Drive a blocking (e.g. DB-cursor backed) iterator from the event loop.
+
+    StreamingHttpResponse buffers synchronous iterators completely when served
+    over ASGI, so each chunk is pulled through sync_to_async instead. The loop
+    stays free between chunks and only one chunk is held in memory at a time.
+    Iterators that do not touch the database can pass thread_sensitive=False
+    to avoid queueing behind sync views. Outside a request, pass a
+    single-thread executor to keep a cursor on a thread of its own.
+    """
+    if executor is not None:
+        thread_sensitive = False
+    pull = sync_to_async(_next_or_none, thread_sensitive=thread_sensitive, executor=executor)
+    try:
+        while True:
+            chunk = await pull(iterator)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            # Release the server-side cursor if the client went away early
+            await sync_to_async(close, thread_sensitive=thread_sensitive, executor=executor)()
+
+
+def gzip_chunks(chunks):
+    """Compress an iterable of byte chunks into a gzip stream, chunk by chunk."""
+    compressor = zlib.compressobj(wbits=GZIP_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range "Range: bytes=..." header into an inclusive
+    (start, end) pair. Returns None when the whole file should be sent.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', '') or size == 0:
+        # Multiple or malformed ranges: ignoring the header is allowed
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def file_chunks(path, start, length):
+    """Read length bytes of a file from start, a chunk at a time."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -1,3 +1,399 @@
-from django.test import TestCase
+import gzip
+import json
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import SkipTest, mock
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework.test import APITestCase
+from . import heartbeat, presence
+from .models import Attachment, Conversation, ConversationMember, CustomUser, InterestRequest, Message
+from .streaming import RangeNotSatisfiable, parse_range
 
-# Create your tests here.
+
+class FakeConsumer:
+    def __init__(self, user_id):
+        self.user = SimpleNamespace(id=user_id, username=f"user_{user_id}")
+
+
+class PresenceRouteTests(SimpleTestCase):
+    """route() against the Redis configured for the cache."""
+    user_id = 987654321
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            get_redis_connection('default').ping()
+        except Exception as e:
+            raise SkipTest(f"Redis is not reachable: {str(e)}")
+
+    def setUp(self):
+        self.redis = get_redis_connection('default')
+        self.redis.delete(presence._key(self.user_id))
+        self.addCleanup(self.redis.delete, presence._key(self.user_id))
+        self.addCleanup(presence._local_consumers.clear)
+        self.addCleanup(presence._socket_counts.clear)
+        self.addCleanup(presence._channel_layer_until.clear)
+
+    def settle(self):
+        """Age the hash past the point where route() trusts it"""
+        since = time.time() - settings.WEBSOCKET_HEARTBEAT_INTERVAL * 2 - 1
+        self.redis.hset(presence._key(self.user_id), presence.SINCE_FIELD, since)
+
+    async def connect(self):
+        consumer = FakeConsumer(self.user_id)
+        await presence.track_connect(self.user_id)
+        presence.add_local(consumer)
+        return consumer
+
+    async def test_local_only(self):
+        consumer = await self.connect()
+        self.settle()
+        self.assertEqual(await presence.route(self.user_id), [consumer])
+
+    async def test_remote_socket(self):
+        await self.connect()
+        self.redis.hset(presence._key(self.user_id), 'other-process', f"1:{time.time()}")
+        self.settle()
+        self.assertIsNone(await presence.route(self.user_id))
+
+    async def test_dead_process_is_ignored_and_pruned(self):
+        consumer = await self.connect()
+        stale = time.time() - presence._ttl() - 1
+        self.redis.hset(presence._key(self.user_id), 'dead-process', f"1:{stale}")
+        self.settle()
+        self.assertEqual(await presence.route(self.user_id), [consumer])
+        self.assertNotIn(b'dead-process', self.redis.hgetall(presence._key(self.user_id)))
+
+    async def test_channel_layer_decision_is_reused(self):
+        await self.connect()
+        self.redis.hset(presence._key(self.user_id), 'other-process', f"1:{time.time()}")
+        self.settle()
+        self.assertIsNone(await presence.route(self.user_id))
+        with mock.patch.object(presence, '_read_async') as read:
+            self.assertIsNone(await presence.route(self.user_id))
+        read.assert_not_called()
+
+    async def test_offline(self):
+        consumer = await self.connect()
+        presence.remove_local(consumer)
+        await presence.track_disconnect(self.user_id)
+        self.settle()
+        self.assertEqual(await presence.route(self.user_id), [])
+
+    async def test_unknown_without_hash(self):
+        await self.connect()
+        self.redis.delete(presence._key(self.user_id))
+        self.assertIsNone(await presence.route(self.user_id))
+
+    async def test_unknown_while_hash_is_new(self):
+        # e.g. rebuilt after eviction: other processes may not have republished yet
+        await self.connect()
+        self.assertIsNone(await presence.route(self.user_id))
+
+    async def test_unknown_while_socket_is_connecting(self):
+        await self.connect()
+        # Counted, not yet accepted
+        await presence.track_connect(self.user_id)
+        self.settle()
+        self.assertIsNone(await presence.route(self.user_id))
+
+    async def test_unknown_when_redis_fails(self):
+        await self.connect()
+        self.settle()
+        with mock.patch.object(presence, '_read_async', side_effect=ConnectionError):
+            self.assertIsNone(await presence.route(self.user_id))
+
+    async def test_failed_connect_is_not_counted(self):
+        with mock.patch.object(presence, '_publish_async', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                await presence.track_connect(self.user_id)
+        self.assertNotIn(self.user_id, presence._socket_counts)
+
+    async def test_refresh_restores_lost_hash(self):
+        await self.connect()
+        self.redis.delete(presence._key(self.user_id))
+        await presence.refresh()
+        self.assertIn(presence.PROCESS_ID.encode(), self.redis.hgetall(presence._key(self.user_id)))
+        self.assertGreater(self.redis.ttl(presence._key(self.user_id)), 0)
+
+
+class HeartbeatTests(SimpleTestCase):
+    async def test_failing_socket_does_not_stop_the_round(self):
+        broken, healthy = FakeConsumer(1), FakeConsumer(2)
+        broken.send_ping = mock.AsyncMock(side_effect=ConnectionError)
+        healthy.send_ping = mock.AsyncMock()
+        broken.last_seen = healthy.last_seen = float('inf')
+        with mock.patch.object(presence, 'all_local', return_value=[broken, healthy]), \
+                mock.patch.object(presence, 'refresh', mock.AsyncMock()) as refresh:
+            await heartbeat.ping_or_reap()
+        healthy.send_ping.assert_awaited_once()
+        refresh.assert_awaited_once()
+
+
+async def read_streaming(response):
+    return b''.join([chunk async for chunk in response.streaming_content])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class ApiTestCase(APITestCase):
+    """Runs without Redis: the cache and channel layer stay in memory."""
+
+    def setUp(self):
+        self.alice = self.make_user('alice')
+        self.bob = self.make_user('bob')
+        self.client.force_authenticate(self.alice)
+
+    @staticmethod
+    def make_user(name):
+        return CustomUser.objects.create_user(username=name, email=f"{name}@example.com", password='password123')
+
+    def connect(self, user, other_user):
+        return InterestRequest.objects.create(sender=user, receiver=other_user, status='accepted')
+
+
+class MessageExportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.connect(self.alice, self.bob)
+        for index in range(3):
+            sender, receiver = (self.alice, self.bob) if index % 2 else (self.bob, self.alice)
+            Message.objects.create(sender=sender, receiver=receiver, content=f"message {index}")
+
+    def export(self, **params):
+        response = self.client.get(reverse('message_export', args=[self.bob.id]), params)
+        return response, async_to_sync(read_streaming)(response)
+
+    def test_ndjson(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = body.decode().splitlines()
+        self.assertEqual([json.loads(line)['content'] for line in lines], ['message 0', 'message 1', 'message 2'])
+
+    def test_gzip(self):
+        response, body = self.export(compress='gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.ndjson.gz', response['Content-Disposition'])
+        lines = gzip.decompress(body).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+
+    def test_requires_connection(self):
+        InterestRequest.objects.all().delete()
+        response = self.client.get(reverse('message_export', args=[self.bob.id]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_compress_option(self):
+        response = self.client.get(reverse('message_export', args=[self.bob.id]), {'compress': 'zip'})
+        self.assertEqual(response.status_code, 400)
+
+
+class VersionedResponseTests(ApiTestCase):
+    def test_not_modified_until_a_write(self):
+        url = reverse('interest_request')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Bob's interest lands in Alice's received list
+        self.client.force_authenticate(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url, {'receiver_id': self.alice.id}).status_code, 201)
+        self.client.force_authenticate(self.alice)
+
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(len(changed.data), 1)
+
+    def test_if_modified_since_alone_is_not_answered(self):
+        url = reverse('interest_request')
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+
+class BulkInterestTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.carol = self.make_user('carol')
+        self.dave = self.make_user('dave')
+
+    def test_send_skips_self_unknown_and_already_sent(self):
+        InterestRequest.objects.create(sender=self.alice, receiver=self.carol)
+        missing_id = self.dave.id + 1000
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('interest_request_bulk'), {
+                'receiver_ids': [self.bob.id, self.carol.id, self.dave.id, self.alice.id, missing_id],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(sent['receiver_id'] for sent in response.data['sent']), [self.bob.id, self.dave.id])
+        self.assertEqual(response.data['skipped'], sorted([self.carol.id, self.alice.id, missing_id]))
+        self.assertEqual(InterestRequest.objects.filter(sender=self.alice).count(), 3)
+
+    def test_accept_skips_what_is_not_pending_for_the_user(self):
+        pending = [InterestRequest.objects.create(sender=user, receiver=self.alice) for user in (self.bob, self.carol)]
+        answered = InterestRequest.objects.create(sender=self.dave, receiver=self.alice, status='rejected')
+        not_mine = InterestRequest.objects.create(sender=self.bob, receiver=self.carol)
+        InterestRequest.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        ids = [interest.id for interest in pending] + [answered.id, not_mine.id]
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('interest_request_bulk'), {'ids': ids, 'action': 'accept'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], sorted(interest.id for interest in pending))
+        self.assertEqual(response.data['skipped'], sorted([answered.id, not_mine.id]))
+        # One UPDATE for all of them, which also moves updated_at for delta sync
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries.captured_queries), 1)
+        recent = timezone.now() - timedelta(minutes=1)
+        self.assertEqual(
+            set(InterestRequest.objects.filter(updated_at__gt=recent).values_list('id', 'status')),
+            {(interest.id, 'accepted') for interest in pending},
+        )
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_whole_file(self):
+        for header in (None, '', 'items=0-1', 'bytes=0-1,5-6', 'bytes=-', 'bytes=a-b'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1000))
+        self.assertIsNone(parse_range('bytes=0-10', 0))
+
+    def test_ranges(self):
+        cases = {
+            'bytes=0-99': (0, 99),
+            'bytes=900-': (900, 999),
+            'bytes=0-5000': (0, 999),
+            'bytes=-100': (900, 999),
+            'bytes=-5000': (0, 999),
+            ' bytes=10-10 ': (10, 10),
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 1000), expected)
+
+    def test_not_satisfiable(self):
+        for header in ('bytes=1000-', 'bytes=5-2', 'bytes=-0'):
+            with self.subTest(header=header), self.assertRaises(RangeNotSatisfiable):
+                parse_range(header, 1000)
+
+
+class AttachmentDownloadTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, ATTACHMENT_ACCEL_REDIRECT_PREFIX='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.carol = self.make_user('carol')
+        self.conversation = Conversation.objects.create(name='group', created_by=self.alice)
+        ConversationMember.objects.bulk_create([
+            ConversationMember(conversation=self.conversation, user=user) for user in (self.alice, self.bob)
+        ])
+
+    def attach(self, content_type, **message):
+        attachment = Attachment(uploader=self.alice, name='file.bin', content_type=content_type, size=10)
+        if message:
+            attachment.message = Message.objects.create(sender=self.alice, content='', **message)
+        attachment.file.save('file.bin', ContentFile(b'0123456789'))
+        return attachment
+
+    def download(self, attachment, user, **headers):
+        self.client.force_authenticate(user)
+        response = self.client.get(reverse('attachment_download', args=[attachment.id]), **headers)
+        body = async_to_sync(read_streaming)(response) if response.streaming else response.content
+        return response, body
+
+    def test_participants_only(self):
+        direct = self.attach('image/png', receiver=self.bob)
+        group = self.attach('image/png', conversation=self.conversation)
+        unsent = self.attach('image/png')
+        cases = [
+            (direct, self.alice, 200), (direct, self.bob, 200), (direct, self.carol, 404),
+            (group, self.bob, 200), (group, self.carol, 404),
+            (unsent, self.alice, 200), (unsent, self.bob, 404),
+        ]
+        for attachment, user, expected in cases:
+            with self.subTest(attachment=attachment.id, user=user.username):
+                self.assertEqual(self.download(attachment, user)[0].status_code, expected)
+
+    def test_range(self):
+        response, body = self.download(self.attach('image/png'), self.alice, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(body, b'2345')
+
+        response, _ = self.download(self.attach('image/png'), self.alice, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_untrusted_type_is_a_download(self):
+        response, _ = self.download(self.attach('text/html'), self.alice)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class SyncTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.carol = self.make_user('carol')
+        self.dave = self.make_user('dave')
+        self.with_bob = self.connect(self.alice, self.bob)
+        self.connect(self.carol, self.alice)
+        InterestRequest.objects.create(sender=self.dave, receiver=self.alice)
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        InterestRequest.objects.update(updated_at=an_hour_ago)
+        CustomUser.objects.update(updated_at=an_hour_ago)
+
+    def sync(self, **params):
+        response = self.client.get(reverse('sync'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_full(self):
+        data = self.sync()
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['interests']['sent']), 1)
+        self.assertEqual(len(data['interests']['received']), 2)
+        self.assertEqual({user['id'] for user in data['connections']['connected']}, {self.bob.id, self.carol.id})
+
+    def test_delta_returns_only_changes_since_the_token(self):
+        token = self.sync()['token']
+        unchanged = self.sync(since=token)
+        self.assertEqual(unchanged['interests'], {'sent': [], 'received': []})
+        self.assertEqual(unchanged['users'], [])
+
+        self.with_bob.status = 'rejected'
+        self.with_bob.save()
+        self.carol.first_name = 'Caroline'
+        self.carol.save()
+
+        data = self.sync(since=token)
+        self.assertFalse(data['full'])
+        self.assertEqual([interest['id'] for interest in data['interests']['sent']], [self.with_bob.id])
+        self.assertEqual(data['interests']['received'], [])
+        self.assertEqual(data['connections'], {'connected': [], 'disconnected': [self.bob.id]})
+        self.assertEqual([user['id'] for user in data['users']], [self.carol.id])
+
+    def test_invalid_token(self):
+        response = self.client.get(reverse('sync'), {'since': 'nope'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,126 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Renders and database writes of thumbnails not finished yet
+_pending = set()
+# Records finished thumbnails. Done callbacks run on the process pool's
+# management thread, which must not block on (or own) database connections.
+_store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnail-store')
+
+
+def render_thumbnail(source_path, target_path, size):
+    """Runs in a worker process: write a JPEG preview of an image."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        image.save(target_path, 'JPEG', quality=80)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a process that runs an event loop and DB connections is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.ATTACHMENT_THUMBNAIL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def schedule_thumbnail(attachment):
+    """
+    Render the attachment's thumbnail in the process pool and record it when done.
+    Returns immediately; the thumbnail field stays empty until the preview exists.
+    """
+    storage = attachment.file.storage
+    name = storage.get_available_name(f"attachments/thumbnails/{attachment.pk}.jpg")
+    future = get_executor().submit(
+        render_thumbnail,
+        attachment.file.path,
+        storage.path(name),
+        settings.ATTACHMENT_THUMBNAIL_SIZE,
+    )
+    _pending.add(future)
+    future.add_done_callback(lambda done: _hand_over(attachment.pk, name, done))
+    return future
+
+
+def _hand_over(attachment_id, name, future):
+    try:
+        stored = _store_executor.submit(_store_thumbnail, attachment_id, name, future)
+        _pending.add(stored)
+        stored.add_done_callback(_pending.discard)
+    except RuntimeError as e:
+        # The interpreter is shutting down
+        logger.warning(f"Thumbnail for attachment {attachment_id} not recorded: {str(e)}")
+    finally:
+        _pending.discard(future)
+
+
+def _store_thumbnail(attachment_id, name, future):
+    from .models import Attachment
+    from .versioning import bump_versions, conversation_scope, group_scope
+
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.warning(f"Thumbnail for attachment {attachment_id} failed: {str(error)}")
+        return
+    close_old_connections()
+    try:
+        Attachment.objects.filter(pk=attachment_id).update(thumbnail=name)
+        # Serialized messages carry the thumbnail URL: refresh their cached pages
+        message = Attachment.objects.filter(pk=attachment_id, message__isnull=False).values_list(
+            'message__sender_id', 'message__receiver_id', 'message__conversation_id'
+        ).first()
+        if message is not None:
+            sender_id, receiver_id, conversation_id = message
+            bump_versions(group_scope(conversation_id) if conversation_id else conversation_scope(sender_id, receiver_id))
+    except Exception as e:
+        logger.error(f"Error saving thumbnail for attachment {attachment_id}: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def shutdown(timeout=None):
+    """
+    Finish queued thumbnails, waiting at most timeout seconds, and stop the
+    worker processes. Renders still running after that are killed, so a
+    stuck one cannot hold up the process exit.
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is None:
+        return
+    deadline = None if timeout is None else time.monotonic() + timeout
+    # Finished renders queue their database writes, so wait until nothing is added
+    while _pending:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            break
+        wait(list(_pending), timeout=remaining)
+    not_done = set(_pending)
+    executor.shutdown(wait=False, cancel_futures=True)
+    if not_done:
+        logger.warning(f"Stopping {len(not_done)} unfinished thumbnail(s)")
+        # ProcessPoolExecutor has no public way to stop a busy worker (before Python 3.14)
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.terminate()
@@ -1,15 +1,23 @@
 from django.urls import path
-from .views import RegisterView, CustomTokenObtainPairView, LogoutView, CheckAuthView, UserListView, InterestRequestView, ConnectedUsersView, MessageHistoryView
+from .views import RegisterView, CustomTokenObtainPairView, LogoutView, CheckAuthView, UserListView, InterestRequestView, BulkInterestRequestView, ConnectedUsersView, SyncView, MessageHistoryView, MessageExportView, AttachmentUploadView, AttachmentDownloadView, ConversationView, ConversationMessagesView, ReadinessView
 
 urlpatterns = [
     path('auth/register', RegisterView.as_view(), name='register'),
     path('auth/login', CustomTokenObtainPairView.as_view(), name='login'),
     path('auth/logout', LogoutView.as_view(), name='logout'),
     path('auth/check-auth', CheckAuthView.as_view(), name='check-auth'),
+    path('health/ready/', ReadinessView.as_view(), name='readiness'),
     path('users/', UserListView.as_view(), name='user_list'),
     path('interests/', InterestRequestView.as_view(), name='interest_request'),
     path('interests/<int:pk>/', InterestRequestView.as_view(), name='interest_request_detail'),
+    path('interests/bulk/', BulkInterestRequestView.as_view(), name='interest_request_bulk'),
     
     path('connected-users/', ConnectedUsersView.as_view(), name='connected_users'),
+    path('sync/', SyncView.as_view(), name='sync'),
     path('messages/<int:user_id>/', MessageHistoryView.as_view(), name='message_history'),
+    path('messages/<int:user_id>/export/', MessageExportView.as_view(), name='message_export'),
+    path('conversations/', ConversationView.as_view(), name='conversations'),
+    path('conversations/<int:pk>/messages/', ConversationMessagesView.as_view(), name='conversation_messages'),
+    path('attachments/', AttachmentUploadView.as_view(), name='attachment_upload'),
+    path('attachments/<int:pk>/', AttachmentDownloadView.as_view(), name='attachment_download'),
 ]
\ No newline at end of file
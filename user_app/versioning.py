@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .db_routers import read_alias
+
+logger = logging.getLogger(__name__)
+
+# Stamps expire eventually; a recreated stamp only costs clients one refetch
+VERSION_TTL = 7 * 24 * 60 * 60
+
+
+def user_scope(user_id):
+    """Everything listed for a user: interests and connections"""
+    return f"user:{user_id}"
+
+
+def conversation_scope(user_id, other_user_id):
+    """Messages exchanged between two users"""
+    low, high = sorted((int(user_id), int(other_user_id)))
+    return f"conversation:{low}:{high}"
+
+
+def group_scope(conversation_id):
+    """Messages of a group conversation"""
+    return f"group:{conversation_id}"
+
+
+def bump_versions(*scopes):
+    """Invalidate cached responses for these scopes once the current transaction commits"""
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _bump(scopes):
+    now = time.time()
+    try:
+        for scope in scopes:
+            key = f"ver:{scope}"
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Seed missing stamps from the clock so they never repeat an old value
+                if not cache.add(key, time.time_ns(), timeout=VERSION_TTL):
+                    cache.incr(key)
+        cache.set_many({f"mod:{scope}": now for scope in scopes}, timeout=VERSION_TTL)
+    except Exception as e:
+        logger.error(f"Error bumping versions {scopes}: {str(e)}")
+
+
+class VersionStamp:
+    def __init__(self, etag=None, last_modified=None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def not_modified(self, request):
+        """
+        Return a 304 response if the client's copy is still current. Only
+        If-None-Match is honoured: Last-Modified has one-second resolution,
+        so two writes within a second would look unchanged to If-Modified-Since.
+        """
+        if self.etag is None or 'HTTP_IF_NONE_MATCH' not in request.META:
+            return None
+        response = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+        return self.apply(response) if response is not None else None
+
+    def apply(self, response):
+        """
+        Add the validators to a response. Skipped when the data came from a
+        replica: it may lag behind the stamp, and a lagging body saved under
+        a current ETag would be confirmed by 304s until the next write.
+        """
+        if self.etag is not None and read_alias() is None:
+            response['ETag'] = self.etag
+            response['Last-Modified'] = http_date(self.last_modified)
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+def version_stamp(*scopes, variant=''):
+    """
+    Build ETag/Last-Modified validators from the version stamps in Redis.
+
+    Must be read before querying the data it describes: a write landing in
+    between then produces an extra refetch instead of a stale 304. That
+    holds for the primary only, which is why apply() leaves replica reads
+    without validators.
+    """
+    version_keys = [f"ver:{scope}" for scope in scopes]
+    modified_keys = [f"mod:{scope}" for scope in scopes]
+    try:
+        values = cache.get_many(version_keys + modified_keys)
+        for key in version_keys:
+            if key not in values:
+                cache.add(key, time.time_ns(), timeout=VERSION_TTL)
+                values[key] = cache.get(key)
+        now = time.time()
+        for key in modified_keys:
+            if key not in values:
+                cache.add(key, now, timeout=VERSION_TTL)
+                values[key] = now
+    except Exception as e:
+        logger.error(f"Error reading versions {scopes}: {str(e)}")
+        return VersionStamp()
+
+    fingerprint = '|'.join([variant] + [f"{key}={values[key]}" for key in version_keys])
+    etag = '"%s"' % hashlib.md5(fingerprint.encode()).hexdigest()
+    last_modified = int(max(values[key] for key in modified_keys))
+    return VersionStamp(etag, last_modified)
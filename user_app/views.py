@@ -3,14 +3,72 @@ from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated
-from .serializers import RegisterSerializer, UserSerializer, CustomTokenObtainPairSerializer, InterestRequestSerializer, MessageSerializer
+from .serializers import RegisterSerializer, UserSerializer, CustomTokenObtainPairSerializer, InterestRequestSerializer, MessageSerializer, BulkInterestSendSerializer, BulkInterestActionSerializer, AttachmentSerializer, ConversationSerializer
 from django.contrib.auth import get_user_model
-from .models import InterestRequest, Message
-from django.db import models
+from .models import InterestRequest, Message, Attachment, Conversation, ConversationMember
+from django.db import models, transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.conf import settings
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from rest_framework.parsers import MultiPartParser
 from rest_framework_simplejwt.views import TokenObtainPairView
+from itertools import islice
+from datetime import datetime, timedelta, timezone as dt_timezone
+import json
+import os
+from .streaming import iterate_in_thread, gzip_chunks, parse_range, file_chunks, RangeNotSatisfiable
+from .thumbnails import schedule_thumbnail
+from .db_routers import replica_reads, pin_primary
+from .versioning import bump_versions, version_stamp, user_scope, conversation_scope, group_scope
+from .notifications import notify_users
+from . import warmup, drain
 
 User = get_user_model()
 
+# Rows fetched per round trip of the server-side cursor during exports
+EXPORT_CHUNK_SIZE = 2000
+# Attachment types shown inline; anything else is a download, since the
+# stored content type is whatever the uploader claimed
+INLINE_CONTENT_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
+
+
+def has_mutual_connection(user_id, other_user_id):
+    """Check if two users have mutual connection (accepted interest)"""
+    return InterestRequest.objects.filter(
+        models.Q(sender_id=user_id, receiver_id=other_user_id, status='accepted') |
+        models.Q(sender_id=other_user_id, receiver_id=user_id, status='accepted')
+    ).exists()
+
+
+def connected_user_ids(user_id):
+    """Ids of all users mutually connected with a user"""
+    pairs = InterestRequest.objects.filter(
+        models.Q(sender_id=user_id) | models.Q(receiver_id=user_id), status='accepted'
+    ).values_list('sender_id', 'receiver_id')
+    return {receiver_id if sender_id == user_id else sender_id for sender_id, receiver_id in pairs}
+
+
+def encode_sync_token(moment):
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def decode_sync_token(token):
+    """Raises ValueError for tokens not issued by encode_sync_token"""
+    try:
+        return datetime.fromtimestamp(int(token) / 1_000_000, tz=dt_timezone.utc)
+    except (OverflowError, OSError) as e:
+        raise ValueError(str(e))
+
+
+def conversation_messages(user, other_user_id):
+    """Messages exchanged between a user and another user, oldest first"""
+    return Message.objects.filter(
+        models.Q(sender=user, receiver_id=other_user_id) |
+        models.Q(sender_id=other_user_id, receiver=user)
+    ).prefetch_related('attachments').order_by('timestamp')
+
 class RegisterView(APIView):
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
@@ -112,6 +170,10 @@ class UserListView(generics.ListAPIView):
     def get_queryset(self):
         return User.objects.exclude(id=self.request.user.id)
 
+    def list(self, request, *args, **kwargs):
+        with replica_reads(request.user.id):
+            return super().list(request, *args, **kwargs)
+
 
 class InterestRequestView(APIView):
     permission_classes = [IsAuthenticated]
@@ -123,18 +185,27 @@ class InterestRequestView(APIView):
                 return Response({"error": "Cannot send interest to yourself"}, status=status.HTTP_400_BAD_REQUEST)
             if InterestRequest.objects.filter(sender=request.user, receiver=serializer.validated_data['receiver']).exists():
                 return Response({"error": "Interest request already sent"}, status=status.HTTP_400_BAD_REQUEST)
+            receiver_id = serializer.validated_data['receiver'].id
+            pin_primary(request.user.id, receiver_id)
             serializer.save(sender=request.user)
+            bump_versions(user_scope(request.user.id), user_scope(receiver_id))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request):
         interest_type = request.query_params.get('type', 'received')
-        if interest_type == 'sent':
-            interests = InterestRequest.objects.filter(sender=request.user)
-        else:
-            interests = InterestRequest.objects.filter(receiver=request.user)
-        serializer = InterestRequestSerializer(interests, many=True)
-        return Response(serializer.data)
+        stamp = version_stamp(user_scope(request.user.id), variant=f'interests-{interest_type}')
+        not_modified = stamp.not_modified(request)
+        if not_modified:
+            return not_modified
+
+        with replica_reads(request.user.id):
+            if interest_type == 'sent':
+                interests = InterestRequest.objects.filter(sender=request.user)
+            else:
+                interests = InterestRequest.objects.filter(receiver=request.user)
+            serializer = InterestRequestSerializer(interests, many=True)
+            return stamp.apply(Response(serializer.data))
 
     def patch(self, request, pk):
         try:
@@ -143,50 +214,453 @@ class InterestRequestView(APIView):
             if action not in ['accept', 'reject']:
                 return Response({"error": "Invalid action"}, status=status.HTTP_400_BAD_REQUEST)
             interest.status = 'accepted' if action == 'accept' else 'rejected'
+            pin_primary(request.user.id, interest.sender_id)
             interest.save()
+            bump_versions(user_scope(request.user.id), user_scope(interest.sender_id))
             serializer = InterestRequestSerializer(interest)
             return Response(serializer.data)
         except InterestRequest.DoesNotExist:
             return Response({"error": "Interest request not found"}, status=status.HTTP_404_NOT_FOUND)
+
+
+class BulkInterestRequestView(APIView):
+    """
+    Send interests to many users (POST) or answer many pending interests
+    (PATCH) in one request, one transaction and a constant number of queries.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkInterestSendSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        requested_ids = set(serializer.validated_data['receiver_ids'])
+        candidate_ids = requested_ids - {request.user.id}
+        with transaction.atomic():
+            existing_users = set(User.objects.filter(id__in=candidate_ids).values_list('id', flat=True))
+            already_sent = set(InterestRequest.objects.filter(
+                sender=request.user, receiver_id__in=existing_users
+            ).values_list('receiver_id', flat=True))
+            new_ids = existing_users - already_sent
+
+            pin_primary(request.user.id, *new_ids)
+            # Concurrent duplicates are dropped by the (sender, receiver) unique constraint
+            InterestRequest.objects.bulk_create(
+                [InterestRequest(sender=request.user, receiver_id=receiver_id) for receiver_id in new_ids],
+                ignore_conflicts=True
+            )
+            created = list(InterestRequest.objects.filter(
+                sender=request.user, receiver_id__in=new_ids
+            ).values('id', 'receiver_id'))
+            bump_versions(user_scope(request.user.id), *[user_scope(receiver_id) for receiver_id in new_ids])
+
+            sender_data = UserSerializer(request.user).data
+            events = [
+                (interest['receiver_id'], {
+                    'type': 'interest_update_handler',
+                    'interest_id': interest['id'],
+                    'status': 'pending',
+                    'user': sender_data,
+                })
+                for interest in created
+            ]
+            transaction.on_commit(lambda: notify_users(events))
+
+        return Response({
+            'sent': created,
+            'skipped': sorted(requested_ids - new_ids),
+        }, status=status.HTTP_201_CREATED)
+
+    def patch(self, request):
+        serializer = BulkInterestActionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        requested_ids = set(serializer.validated_data['ids'])
+        new_status = 'accepted' if serializer.validated_data['action'] == 'accept' else 'rejected'
+        with transaction.atomic():
+            pending = list(InterestRequest.objects.select_for_update().filter(
+                pk__in=requested_ids, receiver=request.user, status='pending'
+            ).values_list('id', 'sender_id'))
+            updated_ids = [interest_id for interest_id, _ in pending]
+            sender_ids = [sender_id for _, sender_id in pending]
+
+            pin_primary(request.user.id, *sender_ids)
+            # update() skips auto_now, delta sync relies on updated_at
+            InterestRequest.objects.filter(pk__in=updated_ids).update(status=new_status, updated_at=timezone.now())
+            bump_versions(user_scope(request.user.id), *[user_scope(sender_id) for sender_id in sender_ids])
+
+            receiver_data = UserSerializer(request.user).data
+            events = [
+                (sender_id, {
+                    'type': 'interest_update_handler',
+                    'interest_id': interest_id,
+                    'status': new_status,
+                    'user': receiver_data,
+                })
+                for interest_id, sender_id in pending
+            ]
+            transaction.on_commit(lambda: notify_users(events))
+
+        return Response({
+            'status': new_status,
+            'updated': sorted(updated_ids),
+            'skipped': sorted(requested_ids - set(updated_ids)),
+        }, status=status.HTTP_200_OK)
         
 class ConnectedUsersView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # Get accepted interests (sent or received)
-        sent_accepted = InterestRequest.objects.filter(
-            sender=request.user, status='accepted'
-        ).select_related('receiver')
-        received_accepted = InterestRequest.objects.filter(
-            receiver=request.user, status='accepted'
-        ).select_related('sender')
-
-        # Collect unique connected users
-        connected_users = set()
-        for interest in sent_accepted:
-            connected_users.add(interest.receiver)
-        for interest in received_accepted:
-            connected_users.add(interest.sender)
-
-        serializer = UserSerializer(connected_users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        stamp = version_stamp(user_scope(request.user.id), variant='connected-users')
+        not_modified = stamp.not_modified(request)
+        if not_modified:
+            return not_modified
+
+        with replica_reads(request.user.id):
+            # Get accepted interests (sent or received)
+            sent_accepted = InterestRequest.objects.filter(
+                sender=request.user, status='accepted'
+            ).select_related('receiver')
+            received_accepted = InterestRequest.objects.filter(
+                receiver=request.user, status='accepted'
+            ).select_related('sender')
+
+            # Collect unique connected users
+            connected_users = set()
+            for interest in sent_accepted:
+                connected_users.add(interest.receiver)
+            for interest in received_accepted:
+                connected_users.add(interest.sender)
+
+            serializer = UserSerializer(connected_users, many=True)
+            return stamp.apply(Response(serializer.data, status=status.HTTP_200_OK))
+
+
+class SyncView(APIView):
+    """
+    Interests, connections and contact profiles changed since a change token.
+
+    Without ?since the whole state is returned with "full": true. Pass the
+    returned token as ?since on the next call to get only what changed; the
+    indexed updated_at columns keep a sync without changes cheap.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = decode_sync_token(since) - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS)
+            except ValueError:
+                return Response({"error": "Invalid sync token"}, status=status.HTTP_400_BAD_REQUEST)
+        # Taken before reading, so writes landing meanwhile are in the next sync
+        token = encode_sync_token(timezone.now())
+        user = request.user
+
+        with replica_reads(user.id):
+            interests = InterestRequest.objects.filter(
+                models.Q(sender=user) | models.Q(receiver=user)
+            ).select_related('sender', 'receiver')
+            if since is not None:
+                interests = interests.filter(updated_at__gt=since)
+            interests = list(interests)
+
+            # Other side of every listed interest
+            peers = {
+                interest.receiver_id if interest.sender_id == user.id else interest.sender_id:
+                interest.receiver if interest.sender_id == user.id else interest.sender
+                for interest in interests
+            }
+            if since is None:
+                connected_ids = {
+                    interest.receiver_id if interest.sender_id == user.id else interest.sender_id
+                    for interest in interests if interest.status == 'accepted'
+                }
+                changed_users = []
+            else:
+                # A peer stays connected while an interest in either direction is accepted
+                pairs = InterestRequest.objects.filter(
+                    models.Q(sender=user, receiver_id__in=peers) | models.Q(sender_id__in=peers, receiver=user),
+                    status='accepted'
+                ).values_list('sender_id', 'receiver_id') if peers else []
+                connected_ids = {receiver_id if sender_id == user.id else sender_id for sender_id, receiver_id in pairs}
+                changed_users = list(User.objects.filter(updated_at__gt=since).filter(
+                    models.Q(id__in=InterestRequest.objects.filter(receiver=user).values('sender_id')) |
+                    models.Q(id__in=InterestRequest.objects.filter(sender=user).values('receiver_id'))
+                ))
+
+        return Response({
+            'token': token,
+            'full': since is None,
+            'interests': {
+                'sent': InterestRequestSerializer([i for i in interests if i.sender_id == user.id], many=True).data,
+                'received': InterestRequestSerializer([i for i in interests if i.receiver_id == user.id], many=True).data,
+            },
+            'connections': {
+                'connected': UserSerializer([peers[peer_id] for peer_id in connected_ids], many=True).data,
+                'disconnected': sorted(peers.keys() - connected_ids),
+            },
+            'users': UserSerializer(changed_users, many=True).data,
+        }, status=status.HTTP_200_OK)
     
 class MessageHistoryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, user_id):
-        # Verify mutual connection
-        if not (InterestRequest.objects.filter(
-                sender_id=request.user.id, receiver_id=user_id, status='accepted'
-            ).exists() or InterestRequest.objects.filter(
-                sender_id=user_id, receiver_id=request.user.id, status='accepted'
-            ).exists()):
-            return Response({"error": "No mutual connection"}, status=status.HTTP_403_FORBIDDEN)
-
-        # Get messages between the two users
+        # The connection check depends on the user's interests, the list on the conversation
+        stamp = version_stamp(
+            user_scope(request.user.id), conversation_scope(request.user.id, user_id),
+            variant='message-history'
+        )
+        not_modified = stamp.not_modified(request)
+        if not_modified:
+            return not_modified
+
+        with replica_reads(request.user.id):
+            # Verify mutual connection
+            if not has_mutual_connection(request.user.id, user_id):
+                return Response({"error": "No mutual connection"}, status=status.HTTP_403_FORBIDDEN)
+
+            # Get messages between the two users
+            messages = conversation_messages(request.user, user_id)
+            serializer = MessageSerializer(messages, many=True)
+            return stamp.apply(Response(serializer.data, status=status.HTTP_200_OK))
+
+
+class MessageExportView(APIView):
+    """
+    Stream a whole conversation as NDJSON (one serialized message per line).
+
+    Rows are read through a server-side cursor and serialized a chunk at a
+    time, so memory use does not grow with the size of the conversation.
+    Pass ?compress=gzip to receive a gzip-compressed file instead.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, user_id):
+        compress = request.query_params.get('compress')
+        if compress not in (None, 'gzip'):
+            return Response({"error": "Invalid compress option"}, status=status.HTTP_400_BAD_REQUEST)
+
+        with replica_reads(request.user.id):
+            if not has_mutual_connection(request.user.id, user_id):
+                return Response({"error": "No mutual connection"}, status=status.HTTP_403_FORBIDDEN)
+
+            messages = conversation_messages(request.user, user_id).select_related('sender', 'receiver')
+            # The queryset is evaluated lazily while streaming, after this
+            # block exits, so bind it to the database chosen here.
+            messages = messages.using(messages.db)
+        chunks = self.ndjson_chunks(messages)
+        filename = f"conversation_{request.user.id}_{user_id}.ndjson"
+        if compress == 'gzip':
+            chunks = gzip_chunks(chunks)
+            content_type = 'application/gzip'
+            filename += '.gz'
+        else:
+            content_type = 'application/x-ndjson'
+
+        response = StreamingHttpResponse(iterate_in_thread(chunks), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @staticmethod
+    def ndjson_chunks(messages):
+        rows = messages.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        while True:
+            batch = list(islice(rows, EXPORT_CHUNK_SIZE))
+            if not batch:
+                break
+            lines = [json.dumps(item) for item in MessageSerializer(batch, many=True).data]
+            yield ('\n'.join(lines) + '\n').encode()
+
+
+class AttachmentUploadView(APIView):
+    """
+    Upload a file to reference from a chat message by its id.
+
+    The body is streamed to a temporary file (FILE_UPLOAD_HANDLERS) and moved
+    into MEDIA_ROOT; image thumbnails are rendered by a process pool.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        # Daphne has already received the whole body by now, so this only saves
+        # parsing it; nginx's client_max_body_size keeps large uploads out entirely
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            # Left to the multipart parser, which rejects it with a 400
+            content_length = 0
+        if content_length > settings.ATTACHMENT_MAX_SIZE + 64 * 1024:
+            return Response({"error": "File too large"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
+        if upload.size > settings.ATTACHMENT_MAX_SIZE:
+            return Response({"error": "File too large"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        attachment = Attachment.objects.create(
+            uploader=request.user,
+            file=upload,
+            name=upload.name[:255],
+            content_type=upload.content_type or 'application/octet-stream',
+            size=upload.size,
+        )
+        if attachment.content_type in INLINE_CONTENT_TYPES:
+            transaction.on_commit(lambda: schedule_thumbnail(attachment))
+        return Response(AttachmentSerializer(attachment).data, status=status.HTTP_201_CREATED)
+
+
+class AttachmentDownloadView(APIView):
+    """
+    Serve an attachment (or its thumbnail with ?thumbnail=1) to its uploader
+    and to the participants of the message it was sent in.
+
+    Single byte ranges are supported. With ATTACHMENT_ACCEL_REDIRECT_PREFIX
+    set, the transfer is handed to nginx and never occupies Daphne.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        attachment = Attachment.objects.filter(
+            models.Q(uploader=request.user) |
+            models.Q(message__sender=request.user) |
+            models.Q(message__receiver=request.user) |
+            models.Q(message__conversation__memberships__user=request.user),
+            pk=pk
+        ).first()
+        if not attachment:
+            return Response({"error": "Attachment not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.query_params.get('thumbnail'):
+            if not attachment.thumbnail:
+                return Response({"error": "Thumbnail not available"}, status=status.HTTP_404_NOT_FOUND)
+            stored, content_type = attachment.thumbnail, 'image/jpeg'
+        else:
+            stored, content_type = attachment.file, attachment.content_type
+        inline = content_type in INLINE_CONTENT_TYPES
+        if not inline:
+            content_type = 'application/octet-stream'
+
+        if settings.ATTACHMENT_ACCEL_REDIRECT_PREFIX:
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.ATTACHMENT_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + stored.name
+        else:
+            response = self.stream_file(request, stored.path, content_type)
+        response['Content-Disposition'] = content_disposition_header(not inline, attachment.name)
+        # Never let the browser sniff or run uploaded content on the API origin
+        response['X-Content-Type-Options'] = 'nosniff'
+        response['Content-Security-Policy'] = 'sandbox'
+        return response
+
+    @staticmethod
+    def stream_file(request, path, content_type):
+        size = os.path.getsize(path)
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        start, end = byte_range if byte_range else (0, size - 1)
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            iterate_in_thread(file_chunks(path, start, length), thread_sensitive=False),
+            content_type=content_type,
+            status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK
+        )
+        response['Content-Length'] = str(length)
+        response['Accept-Ranges'] = 'bytes'
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        return response
+
+
+class ConversationView(APIView):
+    """List the user's group conversations or create one with connected users."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        conversations = Conversation.objects.filter(
+            memberships__user=request.user
+        ).prefetch_related('members').order_by('-created_at')
+        serializer = ConversationSerializer(conversations, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        serializer = ConversationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        member_ids = set(serializer.validated_data['member_ids']) - {request.user.id}
+        if not member_ids:
+            return Response({"error": "A group needs at least one other member"}, status=status.HTTP_400_BAD_REQUEST)
+        if not member_ids <= connected_user_ids(request.user.id):
+            return Response({"error": "You can only add connected users"}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            conversation = Conversation.objects.create(
+                name=serializer.validated_data['name'], created_by=request.user
+            )
+            ConversationMember.objects.bulk_create([
+                ConversationMember(conversation=conversation, user_id=user_id)
+                for user_id in member_ids | {request.user.id}
+            ])
+            data = ConversationSerializer(conversation).data
+            # Lets connected members join the conversation's channel group right away
+            events = [
+                (user_id, {'type': 'conversation_joined_handler', 'conversation': data})
+                for user_id in member_ids | {request.user.id}
+            ]
+            transaction.on_commit(lambda: notify_users(events))
+
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class ConversationMessagesView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        if not ConversationMember.objects.filter(conversation_id=pk, user=request.user).exists():
+            return Response({"error": "Not a member of this conversation"}, status=status.HTTP_403_FORBIDDEN)
+
+        # Group history is read from the primary: pinning every member after
+        # each message would make sends cost more as groups grow
+        stamp = version_stamp(group_scope(pk), variant='group-history')
+        not_modified = stamp.not_modified(request)
+        if not_modified:
+            return not_modified
+
         messages = Message.objects.filter(
-            models.Q(sender=request.user, receiver_id=user_id) |
-            models.Q(sender_id=user_id, receiver=request.user)
-        ).order_by('timestamp')
+            conversation_id=pk
+        ).select_related('sender').prefetch_related('attachments').order_by('timestamp')
         serializer = MessageSerializer(messages, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return stamp.apply(Response(serializer.data, status=status.HTTP_200_OK))
+
+
+class ReadinessView(View):
+    """
+    Load balancer / container readiness probe.
+
+    The first probe starts the warm-up (database, Redis cache, channel layer,
+    URL resolver, serializers, JWT backend); the worker answers 503 until all
+    of it has been verified, and again once it starts draining for a deploy.
+    A plain async view, so probes never wait for the sync thread pool.
+    """
+    async def get(self, request):
+        if drain.is_draining():
+            return JsonResponse({'status': 'draining'}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                headers={'Cache-Control': 'no-store'})
+
+        warmup.ensure_started()
+        state = warmup.state()
+        return JsonResponse(
+            state,
+            status=status.HTTP_200_OK if state['status'] == 'ready' else status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Cache-Control': 'no-store'}
+        )
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import sys
+import time
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.urls import get_resolver, reverse
+
+logger = logging.getLogger(__name__)
+
+# Set when the ASGI module loads, right after Django is set up
+PROCESS_STARTED = time.monotonic()
+
+_task = None
+_state = {
+    'status': 'cold',
+    'checks': {},
+    'startup_seconds': None,
+}
+
+
+def state():
+    return _state
+
+
+def ensure_started():
+    """Start the warm-up on the running loop unless it is running or done."""
+    global _task
+    if _state['status'] in ('cold', 'failed') and (_task is None or _task.done()):
+        _task = asyncio.get_running_loop().create_task(warm_up())
+        _state['status'] = 'warming'
+
+
+def start_when_serving():
+    """
+    Under Daphne, warm up as soon as the server starts instead of waiting for
+    the first probe. Only uses a Twisted reactor that is already installed.
+    """
+    if 'twisted.internet.reactor' in sys.modules:
+        from twisted.internet import reactor
+        # Runs on the asyncio loop once it is running
+        reactor.callLater(0, ensure_started)
+
+
+async def warm_up():
+    """
+    Open and verify everything the first requests would otherwise pay for.
+    The worker is ready only when every step succeeded; a failed warm-up is
+    retried on the next readiness probe.
+    """
+    started = time.monotonic()
+    checks = {}
+    for name, step in STEPS:
+        step_started = time.monotonic()
+        try:
+            await asyncio.wait_for(step(), settings.WARMUP_STEP_TIMEOUT)
+            checks[name] = {'ok': True}
+        except Exception as e:
+            logger.error(f"Warm-up step {name} failed: {str(e) or type(e).__name__}")
+            checks[name] = {'ok': False, 'error': str(e) or type(e).__name__}
+        checks[name]['ms'] = round((time.monotonic() - step_started) * 1000, 1)
+
+    _state['checks'] = checks
+    if all(check['ok'] for check in checks.values()):
+        _state['startup_seconds'] = round(time.monotonic() - PROCESS_STARTED, 3)
+        _state['status'] = 'ready'
+        logger.info(f"Ready {_state['startup_seconds']}s after start "
+                    f"(warm-up {time.monotonic() - started:.3f}s)")
+    else:
+        _state['status'] = 'failed'
+
+
+@database_sync_to_async
+def _prime_databases():
+    """
+    Check that every database answers. Request threads share nothing with this
+    one, so its own connection is not kept; with DB_CONNECTION_MODE=pool the
+    pool's minimum connections are opened here instead and every request
+    thread checks them out warm.
+    """
+    for alias in ['default', *settings.DATABASE_REPLICAS]:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            pool.open()
+            pool.wait(timeout=settings.WARMUP_STEP_TIMEOUT)
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+
+
+@sync_to_async(thread_sensitive=False)
+def _prime_cache():
+    cache.set('warmup:ping', 1, timeout=60)
+    if cache.get('warmup:ping') != 1:
+        raise RuntimeError("cache read back a different value")
+
+
+async def _prime_channel_layer():
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    await layer.send(channel, {'type': 'warmup.ping'})
+    message = await layer.receive(channel)
+    if message.get('type') != 'warmup.ping':
+        raise RuntimeError("channel layer returned a different message")
+
+
+@sync_to_async
+def _prime_application():
+    from rest_framework_simplejwt.state import token_backend
+    from . import serializers
+
+    # URL patterns are compiled on first use
+    get_resolver().url_patterns
+    reverse('user_list')
+    # ModelSerializer builds its fields lazily, once per instance
+    for serializer_class in (
+        serializers.UserSerializer, serializers.InterestRequestSerializer, serializers.MessageSerializer,
+        serializers.AttachmentSerializer, serializers.ConversationSerializer,
+    ):
+        serializer_class().fields
+    # Loads the signing backend and algorithms used on every authenticated request
+    token_backend.decode(token_backend.encode({'warmup': True}), verify=True)
+
+
+STEPS = [
+    ('database', _prime_databases),
+    ('cache', _prime_cache),
+    ('channel_layer', _prime_channel_layer),
+    ('application', _prime_application),
+]
@@ -9,7 +9,7 @@ django_asgi_app = get_asgi_application()
 # Import routing and middleware after Django is initialized
 from channels.security.websocket import AllowedHostsOriginValidator
 from user_app.middleware import TokenAuthMiddlewareStack
-from user_app import routing
+from user_app import routing, drain, warmup
 
 application = ProtocolTypeRouter({
     'http': django_asgi_app,
@@ -20,4 +20,7 @@ application = ProtocolTypeRouter({
             )
         )
     ),
-})
\ No newline at end of file
+})
+
+drain.install_signal_handler()
+warmup.start_when_serving()
\ No newline at end of file
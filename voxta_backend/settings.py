@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 import environ
+from django.core.exceptions import ImproperlyConfigured
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -145,6 +146,63 @@ DATABASES = {
     }
 }
 
+# Connection handling per worker process:
+#   pool       - psycopg 3 connection pool of DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE
+#                connections shared by all threads of the process (default)
+#   direct     - a new connection per request, closed when it finishes
+#   pgbouncer  - like direct, but to an external PgBouncer running in
+#                transaction mode, which makes connecting cheap; server-side
+#                cursors are disabled because they cannot outlive a pooled
+#                transaction
+# Persistent connections (CONN_MAX_AGE > 0) are never used: under ASGI every
+# request runs its sync code on a new thread, and Django's connections are
+# per thread, so they would be dropped with the thread instead of reused.
+DB_CONNECTION_MODE = env('DB_CONNECTION_MODE', default='pool')
+
+if DB_CONNECTION_MODE == 'pool':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+            'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+            'timeout': env.int('DB_POOL_TIMEOUT', default=10),
+        },
+    }
+    # Makes the pool check each connection before handing it out, so one
+    # dropped by the server or a failover is replaced instead of failing a request
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_CONNECTION_MODE in ('direct', 'pgbouncer'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    if DB_CONNECTION_MODE == 'pgbouncer':
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+else:
+    raise ImproperlyConfigured(f"Unknown DB_CONNECTION_MODE: {DB_CONNECTION_MODE}")
+
+# Optional read replicas, given as host or host:port entries sharing the
+# primary's credentials. History and directory reads are routed to them by
+# user_app.db_routers.ReplicaRouter.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(env.list('DB_REPLICA_HOSTS', default=[])):
+    host, _, port = replica.partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['user_app.db_routers.ReplicaRouter']
+
+# How long a user's reads stay on the primary after they write
+DATABASE_REPLICA_PIN_SECONDS = env.int('DB_REPLICA_PIN_SECONDS', default=10)
+
+# Delta sync re-sends rows changed this long before the client's change token,
+# so rows committed late, written by a server with a skewed clock or not yet
+# on the replica are not missed. Keep it above the longest transaction plus
+# replica lag.
+SYNC_OVERLAP_SECONDS = env.int('SYNC_OVERLAP_SECONDS', default=30)
+
 AUTH_USER_MODEL = 'user_app.CustomUser'
 
 # Password validation
@@ -188,7 +246,38 @@ STATICFILES_DIRS = [
 ]
 
 MEDIA_URL = 'media/'
-MEDIA_ROOT = os.path.join(BASE_DIR / "media")
+# Uploads/ is the directory the README mounts into the container and points
+# nginx's /protected-media/ alias at; all three must name the same place
+MEDIA_ROOT = env('MEDIA_ROOT', default=os.path.join(BASE_DIR / "Uploads"))
+
+# Stream every upload to a temporary file on disk instead of keeping small
+# ones in memory; saving then only moves the file into MEDIA_ROOT.
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
+ATTACHMENT_MAX_SIZE = env.int('ATTACHMENT_MAX_SIZE', default=25 * 1024 * 1024)
+ATTACHMENT_THUMBNAIL_SIZE = (320, 320)
+# Processes used to render thumbnails outside the ASGI event loop
+ATTACHMENT_THUMBNAIL_WORKERS = env.int('ATTACHMENT_THUMBNAIL_WORKERS', default=2)
+# When set (e.g. '/protected-media/'), downloads are handed to nginx through
+# X-Accel-Redirect under this internal location instead of streamed by Daphne
+ATTACHMENT_ACCEL_REDIRECT_PREFIX = env('ATTACHMENT_ACCEL_REDIRECT_PREFIX', default='')
+
+# Retention policies applied by `manage.py apply_retention`:
+#   MESSAGE_RETENTION_DAYS  - messages older than this are removed (0 keeps them forever)
+#   MESSAGE_RETENTION_ACTION - delete | archive (gzipped NDJSON in RETENTION_ARCHIVE_DIR, then delete)
+#   ATTACHMENT_ORPHAN_HOURS - uploads never sent in a message are removed after this
+# Expired JWT outstanding/blacklisted token rows are always removed.
+MESSAGE_RETENTION_DAYS = env.int('MESSAGE_RETENTION_DAYS', default=0)
+MESSAGE_RETENTION_ACTION = env('MESSAGE_RETENTION_ACTION', default='archive')
+if MESSAGE_RETENTION_ACTION not in ('delete', 'archive'):
+    raise ImproperlyConfigured(f"Unknown MESSAGE_RETENTION_ACTION: {MESSAGE_RETENTION_ACTION}")
+RETENTION_ARCHIVE_DIR = env('RETENTION_ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive'))
+ATTACHMENT_ORPHAN_HOURS = env.int('ATTACHMENT_ORPHAN_HOURS', default=24)
+# Rows per transaction, the pause between transactions, and how far (in
+# seconds) a replica may fall behind before the job waits for it
+RETENTION_BATCH_SIZE = env.int('RETENTION_BATCH_SIZE', default=1000)
+RETENTION_BATCH_PAUSE = env.float('RETENTION_BATCH_PAUSE', default=0.2)
+RETENTION_MAX_REPLICA_LAG = env.float('RETENTION_MAX_REPLICA_LAG', default=5.0)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -213,6 +302,18 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'INFO',
         },
+        'user_app.heartbeat': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'user_app.drain': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+        'user_app.warmup': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
         'channels': { 
             'handlers': ['console'],
             'level': 'DEBUG',
@@ -226,15 +327,64 @@ REDIS_PORT = env('REDIS_PORT', default='6379')
 REDIS_PASSWORD = env('REDIS_PASSWORD', default='')
 REDIS_URL = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/0"
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/1",
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    },
+}
+
+# Channel layer
+#   CHANNEL_LAYER_BACKEND    - 'core' (RedisChannelLayer, per-channel queues with
+#                              capacity limits) or 'pubsub' (RedisPubSubChannelLayer,
+#                              Redis PUBLISH per group_send, no per-member writes)
+#   CHANNEL_REDIS_SHARDS     - Redis URLs to spread channels and groups over by
+#                              consistent hashing; defaults to the single REDIS_URL
+#   CHANNEL_LAYER_ENCRYPTION - Fernet-encrypt payloads; only turn off when the
+#                              network between Daphne and Redis is trusted
+# Compare the options with `python manage.py bench_channel_layer`.
+CHANNEL_LAYER_BACKENDS = {
+    'core': 'channels_redis.core.RedisChannelLayer',
+    'pubsub': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+}
+CHANNEL_LAYER_BACKEND = env('CHANNEL_LAYER_BACKEND', default='core')
+if CHANNEL_LAYER_BACKEND not in CHANNEL_LAYER_BACKENDS:
+    raise ImproperlyConfigured(f"Unknown CHANNEL_LAYER_BACKEND: {CHANNEL_LAYER_BACKEND}")
+CHANNEL_REDIS_SHARDS = env.list('CHANNEL_REDIS_SHARDS', default=[]) or [REDIS_URL]
+CHANNEL_LAYER_ENCRYPTION = env.bool('CHANNEL_LAYER_ENCRYPTION', default=True)
+
+# Application-level WebSocket heartbeats: the server pings every interval and
+# closes sockets it has not heard from within the idle timeout
+WEBSOCKET_HEARTBEAT_INTERVAL = env.int('WEBSOCKET_HEARTBEAT_INTERVAL', default=25)
+WEBSOCKET_IDLE_TIMEOUT = env.int('WEBSOCKET_IDLE_TIMEOUT', default=75)
+
+# Graceful drain for rolling deploys (SIGUSR1 or `manage.py drain_websockets`):
+# clients are told to reconnect after a random delay between the min and max,
+# and sockets are closed gradually over the drain window
+DRAIN_WINDOW_SECONDS = env.int('DRAIN_WINDOW_SECONDS', default=10)
+DRAIN_RECONNECT_MIN_MS = env.int('DRAIN_RECONNECT_MIN_MS', default=1000)
+DRAIN_RECONNECT_MAX_MS = env.int('DRAIN_RECONNECT_MAX_MS', default=15000)
+# Longest wait for in-flight frames before shutting down anyway
+DRAIN_TIMEOUT_SECONDS = env.int('DRAIN_TIMEOUT_SECONDS', default=20)
+DRAIN_PIDFILE = env('DRAIN_PIDFILE', default='/tmp/voxta-daphne.pid')
+
+# Longest each warm-up step (database, cache, channel layer, application) may
+# take before the readiness probe reports it as failed
+WARMUP_STEP_TIMEOUT = env.int('WARMUP_STEP_TIMEOUT', default=10)
+
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': CHANNEL_LAYER_BACKENDS[CHANNEL_LAYER_BACKEND],
         'CONFIG': {
-            'hosts': [REDIS_URL],
-            'symmetric_encryption_keys': [SECRET_KEY],
+            'hosts': CHANNEL_REDIS_SHARDS,
         },
     },
 }
+if CHANNEL_LAYER_ENCRYPTION:
+    CHANNEL_LAYERS['default']['CONFIG']['symmetric_encryption_keys'] = [SECRET_KEY]
 
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
@@ -243,4 +393,6 @@ if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
     SECURE_CONTENT_TYPE_NOSNIFF = True
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    # Probes talk plain HTTP to the container
+    SECURE_REDIRECT_EXEMPT = [r'^api/health/']
     X_FRAME_OPTIONS = 'DENY'
\ No newline at end of file